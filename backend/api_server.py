@@ -1,27 +1,225 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
-import json
+import time
+import threading
 from pdf_processor import PDFProcessor   # Your existing class
+from utils.outline_extractor import without_section_text
 from utils.persona_analyzer import PersonaAnalyzer  # Your existing class
+from utils import persona_analyzer
+from utils.outline_cache import OutlineCache
+from utils.outline_store import OutlineStore
+from utils.embedding_store import EmbeddingStore
+from utils import model_registry, metrics
+from utils.job_queue import JobQueue, QueueFull, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from utils.uploads import stream_to_file, UploadTooLarge
+from utils.vector_index import SectionIndex
 
 app = Flask(__name__)
 CORS(app)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_REQUEST_BYTES', 512 * 1024 * 1024))
 
 UPLOAD_FOLDER = '/app/input'
 OUTPUT_FOLDER = '/app/output'
+CACHE_FOLDER = os.environ.get('CACHE_FOLDER', '/app/cache')
 ALLOWED_EXTENSIONS = {'pdf'}
+EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+EXTRACT_TIMEOUT = float(os.environ.get('EXTRACT_TIMEOUT', '120'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+MAX_PENDING_JOBS = int(os.environ.get('MAX_PENDING_JOBS', '50'))
+# Also write the legacy per-PDF <name>.json files into OUTPUT_FOLDER
+EXPORT_JSON = os.environ.get('EXPORT_JSON', '0') == '1'
+PREVIEW_PAGES = int(os.environ.get('PREVIEW_PAGES', '3'))
+OUTLINE_MODE = os.environ.get('OUTLINE_MODE', 'heuristic')  # heuristic, bookmarks or hybrid
+PERSONA_KEYWORD_SCORING = os.environ.get('PERSONA_KEYWORD_SCORING', 'overlap')  # overlap or bm25
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 100 * 1024 * 1024))  # per file
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, '.incoming')  # same filesystem, so renames are atomic
+# How often to index outlines stored by other processes (CLI, directory watcher); 0 syncs at startup only
+LIBRARY_SYNC_SECONDS = float(os.environ.get('LIBRARY_SYNC_SECONDS', '60'))
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+# Built by init_app(), not at import: spawn-based process pools re-import the
+# entry module in every worker, which must not open stores or start threads
+outline_cache = None  # shared across requests so repeated queries over the same PDFs skip parsing
+processor = None
+embedding_store = None
+section_index = None
+outline_store = None
+job_queue = None  # caps concurrent heavy analyses per worker process
+_init_lock = threading.Lock()
+_library_synced = {"seq": 0, "imported": False}  # outline store position already indexed
+_upload_jobs = {}  # content sha256 -> id of the queued or running job extracting it
+_upload_jobs_lock = threading.Lock()
+
+def init_app():
+    """Create the folders, caches, stores and job queue and start the library sync (once per process)"""
+    global outline_cache, processor, embedding_store, section_index, outline_store, job_queue
+    with _init_lock:
+        if job_queue is not None:
+            return app
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+        outline_cache = OutlineCache(CACHE_FOLDER)
+        processor = PDFProcessor(cache=outline_cache, outline_mode=OUTLINE_MODE)
+        # Vectors from different embedding backends are not comparable, so each gets its own store and index
+        model_id = model_registry.model_id()
+        embedding_store = EmbeddingStore(os.path.join(CACHE_FOLDER, 'embeddings'), model_id)
+        index_dir = (os.path.join(CACHE_FOLDER, 'section_index') if model_id == model_registry.DEFAULT_MODEL
+                     else os.path.join(embedding_store.directory, 'section_index'))
+        section_index = SectionIndex(index_dir)
+        outline_store = OutlineStore(os.path.join(CACHE_FOLDER, 'outlines.db'))
+        threading.Thread(target=_library_sync_loop, name='library-sync', daemon=True).start()
+        job_queue = JobQueue(os.path.join(CACHE_FOLDER, 'jobs'), max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS)
+    return app
+
+@app.before_request
+def _ensure_initialized():
+    # Servers that import app directly (gunicorn api_server:app) initialize on the first request
+    init_app()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/api/analyze-persona', methods=['POST'])
-def analyze_persona():
-    data = request.get_json()
+def upload_name(filename):
+    """Keep the client's file name (the frontend refers to it later) but drop any path"""
+    name = os.path.basename((filename or '').replace('\\', '/'))
+    return name if name and not name.startswith('.') else ''
+
+def _embed_sections(texts):
+    encoder = model_registry.get_encoder()
+    return embedding_store.get_embeddings(texts, encoder.encode)
+
+def index_outline(filename, outline_result):
+    """Add a successfully extracted document to the corpus-wide section index"""
+    if outline_result.get('success') and model_registry.get_encoder() is not None:
+        section_index.add_document(filename, outline_result.get('outline', []), _embed_sections)
+
+def sync_library():
+    """Index outlines stored since the last sync and drop documents no longer stored"""
+    if not _library_synced["imported"]:
+        # Pick up per-PDF JSON files written before the outline store existed
+        outline_store.import_json_dir(OUTPUT_FOLDER)
+        _library_synced["imported"] = True
+    for seq, filename, outline_result in outline_store.iter_outlines(since_seq=_library_synced["seq"]):
+        index_outline(filename, outline_result)
+        _library_synced["seq"] = seq
+    # Deletions (e.g. by the directory watcher) leave no seq to follow, so compare the filenames.
+    # Documents are stored before they are indexed, so reading the index first cannot drop a new one
+    indexed = set(section_index.documents())
+    stored = {doc["filename"] for doc in outline_store.documents()}
+    for filename in indexed - stored:
+        section_index.remove_document(filename)
+
+def _library_sync_loop():
+    # Documents ingested through this server are indexed as they are stored;
+    # this catches up with everything else off the request path
+    while True:
+        try:
+            sync_library()
+        except Exception as e:
+            print(f"Warning: library sync failed: {e}")
+        if LIBRARY_SYNC_SECONDS <= 0:
+            return
+        time.sleep(LIBRARY_SYNC_SECONDS)
+
+def run_full_extraction(filenames, job):
+    """Background upgrade of previews: extract, store and index the full outlines"""
+    file_paths = [os.path.join(UPLOAD_FOLDER, filename) for filename in filenames]
+    job.set_stage('extracting')
+    for file_path, outline_result in processor.extract_many(file_paths, workers=EXTRACT_WORKERS,
+                                                            timeout=EXTRACT_TIMEOUT, ordered=False):
+        filename = os.path.basename(file_path)
+        outline_result = dict(outline_result, filename=filename)
+        outline_store.put(filename, outline_result)
+        index_outline(filename, outline_result)
+        job.set_document_status(filename, 'extracted' if outline_result.get('success') else 'failed')
+        job.check_cancelled()
+    return {"documents": outline_store.documents(filenames)}
+
+def ingest_upload(filename, stream):
+    """Stream one upload into UPLOAD_FOLDER and return its outline if already known.
+
+    Identical content under the same name is not rewritten. Content whose
+    outline is cached (under any name) is answered immediately; anything
+    else is reported as "pending" for the caller to queue.
+    """
+    tmp_path, size, digest = stream_to_file(stream, INCOMING_FOLDER, MAX_UPLOAD_BYTES)
+    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    duplicate = os.path.exists(file_path) and outline_cache.content_hash(file_path) == digest
+    if duplicate:
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, file_path)
+        outline_cache.remember_hash(file_path, digest)
+
+    entry = {"filename": filename, "size": size, "sha256": digest, "duplicate": duplicate}
+    cached = outline_cache.get(outline_cache.make_key(digest, processor.extractor.cache_key()))
+    if cached is not None:
+        outline_result = dict(cached, filename=filename)
+        outline_store.put(filename, outline_result)
+        index_outline(filename, outline_result)
+        entry.update(status="cached", outline=without_section_text(outline_result))
+    else:
+        entry["status"] = "pending"
+    return entry
+
+def _active_upload_jobs():
+    """_upload_jobs without the entries of finished (or forgotten) jobs"""
+    with _upload_jobs_lock:
+        for digest, job_id in list(_upload_jobs.items()):
+            status = job_queue.status(job_id)
+            if status is None or status["status"] not in (QUEUED, RUNNING):
+                del _upload_jobs[digest]
+        return dict(_upload_jobs)
+
+def queue_upload_extraction(entries):
+    """Queue one extraction job for the pending uploads, reusing in-flight jobs for identical content"""
+    active = _active_upload_jobs()
+    new = []
+    for entry in entries:
+        if entry["status"] != "pending":
+            continue
+        job_id = active.get(entry["sha256"])
+        if job_id is not None:
+            entry.update(status="queued", job_id=job_id)
+        else:
+            new.append(entry)
+    if not new:
+        return
+
+    filenames = [entry["filename"] for entry in new]
+    try:
+        job = job_queue.submit('extract', filenames, lambda job: run_full_extraction(filenames, job))
+    except QueueFull as e:
+        for entry in new:
+            entry.update(status="stored", error=str(e))
+        return
+    with _upload_jobs_lock:
+        for entry in new:
+            _upload_jobs[entry["sha256"]] = job.id
+    for entry in new:
+        entry.update(status="queued", job_id=job.id)
+
+def wait_for_upload_extraction(file_paths, in_job=False):
+    """Wait for upload jobs already extracting any of file_paths, so their outlines come from the cache.
 
+    Inside a queued job only running extractions are awaited: a queued one
+    may need the very worker thread that would be blocked.
+    """
+    active = _active_upload_jobs()
+    if not active:
+        return
+    job_ids = {active.get(outline_cache.content_hash(path)) for path in file_paths}
+    deadline = time.monotonic() + EXTRACT_TIMEOUT
+    for job_id in job_ids - {None}:
+        status = job_queue.status(job_id)
+        if status is None or (in_job and status["status"] != RUNNING):
+            continue
+        with metrics.stage('wait_upload_extraction'):
+            job_queue.wait(job_id, timeout=max(deadline - time.monotonic(), 0))
+
+def run_persona_analysis(data, job=None):
+    """Extract, rank and format a persona analysis; reports progress to job if given"""
     challenge_info = data.get("challenge_info", {})
     documents = data.get("documents", [])
     persona_obj = data.get("persona", {})
@@ -32,29 +230,51 @@ def analyze_persona():
 
     input_filenames = [doc.get("filename") for doc in documents if "filename" in doc]
 
-    # Load and process each document
-    processor = PDFProcessor()
+    # Load and process each document (cached outlines are reused)
     results = []
 
-    for doc in documents:
-        filename = doc.get("filename")
-        title = doc.get("title", "Untitled")
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
+    # Sanity check: file should exist
+    existing_docs = [doc for doc in documents
+                     if doc.get("filename") and os.path.exists(os.path.join(UPLOAD_FOLDER, doc["filename"]))]
+    file_paths = [os.path.join(UPLOAD_FOLDER, doc["filename"]) for doc in existing_docs]
 
-        # Sanity check: file should exist
-        if not os.path.exists(file_path):
-            continue  # or handle error
+    if job is not None:
+        for filename in input_filenames:
+            if os.path.join(UPLOAD_FOLDER, filename) not in file_paths:
+                job.set_document_status(filename, 'missing')
+        job.set_stage('extracting')
+
+    # Uploads still being extracted in the background are awaited instead of parsed twice
+    wait_for_upload_extraction(file_paths, in_job=job is not None)
+
+    # Extract outlines in parallel; results are collected as they complete
+    extracted = {}
+    with metrics.stage('extract_outlines'):
+        for file_path, outline_result in processor.extract_many(file_paths, workers=EXTRACT_WORKERS,
+                                                                timeout=EXTRACT_TIMEOUT, ordered=False):
+            extracted[file_path] = outline_result
+            if job is not None:
+                job.set_document_status(os.path.basename(file_path),
+                                        'extracted' if outline_result.get('success') else 'failed')
+                job.check_cancelled()
 
-        # Extract outline/sections here using your PDFProcessor or similar
-        outline_result = processor.extractor.extract_outline(file_path)
+    for doc, file_path in zip(existing_docs, file_paths):
+        filename = doc["filename"]
+        outline_result = dict(extracted[file_path])
         outline_result['filename'] = filename
-        outline_result['title'] = title
+        outline_result['title'] = doc.get("title", "Untitled")
         results.append(outline_result)
 
-        # Save or cache JSON result if needed
-        output_path = os.path.join(OUTPUT_FOLDER, filename.replace('.pdf', '.json'))
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(outline_result, f, indent=2, ensure_ascii=False)
+        with metrics.stage('store_outline'):
+            outline_store.put(filename, outline_result)
+        if EXPORT_JSON:
+            output_path = os.path.join(OUTPUT_FOLDER, filename.replace('.pdf', '.json'))
+            with metrics.stage('write_json'):
+                outline_store.export_json(filename, output_path)
+
+        # Make the document searchable library-wide (no-op if already indexed)
+        with metrics.stage('index_library'):
+            index_outline(filename, outline_result)
 
     # Flatten all extracted sections from all documents
     all_sections = []
@@ -67,12 +287,16 @@ def analyze_persona():
                 "page_number": section.get('page', None),
             })
 
-    # Perform persona-driven importance ranking (using your PersonaAnalyzer)
-    analyzer = PersonaAnalyzer()
+    if job is not None:
+        job.set_stage('ranking')
+
+    # Perform persona-driven importance ranking (the model is shared per worker)
+    analyzer = PersonaAnalyzer(embedding_store=embedding_store, keyword_scoring=PERSONA_KEYWORD_SCORING)
     # Assuming your analyzer can consume these parameters and return ranking and refined contents.
-    analysis_result = analyzer.analyze_documents_for_persona(
-        results, persona_role, job_task
-    )
+    with metrics.stage('persona_analysis'):
+        analysis_result = analyzer.analyze_documents_for_persona(
+            results, persona_role, job_task
+        )
 
     # The analysis_result should include ranked sections and subsection analysis
     # Here, adapt to produce output keys expected, e.g.:
@@ -99,7 +323,7 @@ def analyze_persona():
             "page_number": subsec.get('page_number', 0),
         })
 
-    response = {
+    return {
         "metadata": {
             "input_documents": input_filenames,
             "persona": persona_role,
@@ -109,8 +333,212 @@ def analyze_persona():
         "subsection_analysis": subsection_analysis
     }
 
+
+@app.route('/api/analyze-persona', methods=['POST'])
+def analyze_persona():
+    data = request.get_json()
+    # ?timings=1 (or "include_timings": true) adds a per-stage breakdown to the response
+    if request.args.get('timings') == '1' or data.get('include_timings'):
+        with metrics.collect() as timings, metrics.stage('analyze_persona_request'):
+            result = run_persona_analysis(data)
+        result["timings"] = timings.to_dict()
+        return jsonify(result)
+
+    with metrics.stage('analyze_persona_request'):
+        return jsonify(run_persona_analysis(data))
+
+
+@app.route('/api/upload/<path:filename>', methods=['PUT', 'POST'])
+def upload_file(filename):
+    """Stream a raw PDF request body to disk and queue its extraction"""
+    filename = upload_name(filename)
+    if not allowed_file(filename):
+        return jsonify({"error": "Only PDF files are accepted"}), 400
+    try:
+        entry = ingest_upload(filename, request.stream)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    queue_upload_extraction([entry])
+    return jsonify(entry)
+
+
+@app.route('/api/upload-multiple', methods=['POST'])
+def upload_multiple():
+    """Multipart upload of files[]; large parts are spooled to disk by the form parser"""
+    entries = []
+    for storage in request.files.getlist('files[]') or request.files.getlist('files'):
+        filename = upload_name(storage.filename)
+        if not allowed_file(filename):
+            entries.append({"filename": storage.filename, "status": "rejected", "error": "Only PDF files are accepted"})
+            continue
+        try:
+            entries.append(ingest_upload(filename, storage.stream))
+        except UploadTooLarge as e:
+            entries.append({"filename": filename, "status": "rejected", "error": str(e)})
+    queue_upload_extraction(entries)
+    if entries and all(entry["status"] == "rejected" for entry in entries):
+        return jsonify({"files": entries}), 400
+    return jsonify({"files": entries})
+
+
+@app.route('/api/preview', methods=['POST'])
+def preview_documents():
+    """Quick title/outline previews; full extraction of previewed files continues as a job"""
+    data = request.get_json() or {}
+    max_pages = int(data.get("max_pages", PREVIEW_PAGES))
+    filenames = [doc.get("filename") for doc in data.get("documents", []) if doc.get("filename")]
+
+    previews = []
+    for filename in filenames:
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        if not os.path.exists(file_path):
+            previews.append({"filename": filename, "success": False, "error": "File not found"})
+            continue
+        preview = processor.extractor.extract_preview(file_path, max_pages=max_pages)
+        preview["filename"] = filename
+        if not preview.get("preview") and preview.get("success"):
+            outline_store.put(filename, {k: v for k, v in preview.items()
+                                         if k not in ("preview", "confidence", "source")})
+        previews.append(without_section_text(preview))
+
+    response = {"documents": previews}
+    pending = [p["filename"] for p in previews if p.get("preview")]
+    if pending:
+        try:
+            job = job_queue.submit('extract', pending, lambda job: run_full_extraction(pending, job))
+            response["upgrade_job"] = {"job_id": job.id, "status_url": f"/api/jobs/{job.id}"}
+        except QueueFull as e:
+            response["upgrade_job"] = {"error": str(e)}
     return jsonify(response)
 
 
+@app.route('/api/library/search', methods=['POST'])
+def search_library():
+    """Rank sections across every extracted document by persona/job relevance"""
+    data = request.get_json() or {}
+    persona = data.get("persona", "")
+    job_to_be_done = data.get("job_to_be_done", "")
+    persona_role = persona.get("role", "") if isinstance(persona, dict) else persona
+    job_task = job_to_be_done.get("task", "") if isinstance(job_to_be_done, dict) else job_to_be_done
+    top_k = max(1, min(int(data.get("top_k", 15)), 100))
+
+    encoder = model_registry.get_encoder()
+    if encoder is None:
+        return jsonify({"error": "Embedding model not available"}), 503
+
+    context = f"{persona_role} needs to {job_task}"
+    results = section_index.search(encoder.encode([context])[0], top_k=top_k)
+    for rank, result in enumerate(results, 1):
+        result["importance_rank"] = rank
+
+    return jsonify({
+        "metadata": {
+            "persona": persona_role,
+            "job_to_be_done": job_task,
+            "indexed_documents": section_index.stats()["documents"]
+        },
+        "extracted_sections": results
+    })
+
+
+@app.route('/api/documents', methods=['GET'])
+def list_documents():
+    """Metadata of every stored outline, without loading the headings"""
+    return jsonify(outline_store.documents())
+
+
+@app.route('/api/outlines/<path:filename>', methods=['GET'])
+def get_outline(filename):
+    """One document's outline in the per-PDF JSON format"""
+    outline_result = outline_store.get(filename)
+    if outline_result is None:
+        return jsonify({"error": "Unknown document"}), 404
+    return jsonify(outline_result)
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a persona analysis and return its job id immediately"""
+    data = request.get_json() or {}
+    filenames = [doc.get("filename") for doc in data.get("documents", []) if "filename" in doc]
+
+    try:
+        job = job_queue.submit('analyze-persona', filenames, lambda job: run_persona_analysis(data, job))
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "result_url": f"/api/jobs/{job.id}/result"
+    }), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if status["status"] in (FAILED, CANCELLED):
+        return jsonify(status), 409
+    if status["status"] != DONE:
+        return jsonify(status), 202
+    return jsonify(job_queue.result(job_id))
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    status = job_queue.cancel(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "outlines": outline_cache.stats(),
+        "embeddings": embedding_store.stats(),
+        "section_index": section_index.stats(),
+        "outline_store": outline_store.stats(),
+        "persona": persona_analyzer.cache_stats()
+    })
+
+
+@app.route('/api/encoder/stats', methods=['GET'])
+def encoder_stats():
+    return jsonify(model_registry.encoder_stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Per-stage timings, pipeline counters and cache gauges of this worker process, labelled with its pid"""
+    gauges = {}
+    for prefix, stats in (("outline_cache", outline_cache.stats()),
+                          ("embedding_store", embedding_store.stats()),
+                          ("section_index", section_index.stats()),
+                          ("outline_store", outline_store.stats())):
+        for name, value in stats.items():
+            gauges[f"{prefix}_{name}"] = value
+    return Response(metrics.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/metrics/memory', methods=['GET'])
+def memory_metrics():
+    """Top allocation sites; empty unless started with METRICS_TRACEMALLOC=1"""
+    limit = min(int(request.args.get('limit', 10)), 100)
+    return jsonify({"tracing": metrics.TRACEMALLOC, "top": metrics.memory_snapshot(limit)})
+
+
 if __name__ == '__main__':
+    init_app()
     app.run(host='0.0.0.0', port=8000)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Compare embedding backends on synthetic section titles.
+
+For each backend: load time, resident memory added by loading, serialized
+model size, encode throughput, and how many of the top-k titles for a set of
+persona queries agree with the first backend listed (the reference).
+Backends whose dependencies are missing are reported as skipped.
+
+Run from backend/:  python benchmarks/bench_embedding_backends.py --titles 5000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from utils.embedding_backends import BACKENDS, load_backend
+from utils.embedding_store import l2_normalize
+from utils import model_registry
+from benchmarks.synthetic_pdf import WORDS, HEADING_WORDS
+
+QUERIES = [
+    "PhD researcher needs to review the evaluation results",
+    "Student needs to understand the basic concepts",
+    "Analyst needs to compare performance data",
+    "Developer needs to implement the system model",
+]
+
+
+def synthetic_titles(rng, count):
+    return [f"{rng.choice(HEADING_WORDS)} " + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+            for _ in range(count)]
+
+
+def top_k(backend, titles_matrix, k):
+    queries = l2_normalize(backend.encode(QUERIES))
+    return [set(np.argsort(-(titles_matrix @ q), kind='stable')[:k].tolist()) for q in queries]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--model', default=model_registry.DEFAULT_MODEL)
+    parser.add_argument('--titles', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--top-k', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    titles = synthetic_titles(random.Random(args.seed), args.titles)
+    reference = None
+    for name in args.backends.split(','):
+        try:
+            backend = load_backend(name, args.model)
+        except Exception as e:
+            print(f"{name:22s} skipped: {e}")
+            continue
+
+        start = time.perf_counter()
+        matrix = l2_normalize(backend.encode(titles, batch_size=args.batch_size))
+        elapsed = time.perf_counter() - start
+        tops = top_k(backend, matrix, args.top_k)
+        if reference is None:
+            reference = tops
+        agreement = np.mean([len(a & b) / args.top_k for a, b in zip(tops, reference)])
+
+        stats = backend.stats()
+        print(f"{name:22s} dim {stats['dim']:4d}  load {stats['load_seconds']:7.2f} s  "
+              f"+rss {stats['load_rss_bytes'] / 2**20:7.1f} MiB  model {stats['model_bytes'] / 2**20:7.1f} MiB  "
+              f"{len(titles) / elapsed:9.0f} titles/s  top-{args.top_k} agreement {agreement:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Compare the original per-line regex loop with the compiled HeadingClassifier.
+
+Both classify the same grouped lines of synthetic pages; the decisions must
+be identical. The original lowercases every char's fontname per line, the
+classifier decides bold once per fontname and ORs it per line.
+
+Run from backend/:  python benchmarks/bench_heading_classifier.py --pages 40
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.char_table import CharTable
+from utils.heading_rules import HeadingClassifier
+from benchmarks.bench_line_grouping import synthetic_page_chars
+
+
+def original_is_heading(text, font_size, font_names):
+    """The pre-HeadingClassifier rules, kept verbatim for comparison"""
+    if len(text) < 3:
+        return False
+    if len(text) > 200:
+        return False
+    heading_patterns = [
+        r'^\d+\.?\s+[A-Z]',
+        r'^[A-Z][A-Z\s]{2,}$',
+        r'^[A-Z][a-z\s]+:?$',
+        r'^\d+\.\d+',
+        r'^(Chapter|Section|Part)\s+\d+',
+    ]
+    for pattern in heading_patterns:
+        if re.match(pattern, text.strip()):
+            return True
+    if font_size > 12:
+        return True
+    has_bold = any('bold' in name.lower() for name in font_names)
+    return has_bold and len(text) < 100
+
+
+def page_lines(chars):
+    """The page's CharTable and (text, average size, per-char fontnames) for every line"""
+    table = CharTable(chars)
+    fontnames = [table.fontnames[code] for code in table.font_codes.tolist()]
+    starts, ends = table.line_starts.tolist(), table.line_ends.tolist()
+    return table, [(text, size, fontnames[starts[i]:ends[i]]) for i, text, size in table.iter_lines()]
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--lines', type=int, default=80)
+    parser.add_argument('--chars-per-line', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [page_lines(synthetic_page_chars(rng, args.lines, args.chars_per_line)) for _ in range(args.pages)]
+    lines = [line for _, page in pages for line in page]
+    classifier = HeadingClassifier()
+
+    def run_original():
+        return [original_is_heading(text, size, fonts) for text, size, fonts in lines]
+
+    def run_compiled():
+        classifier.new_document()
+        decisions = []
+        for table, page in pages:
+            line_bold = table.line_flags(classifier.bold_fonts(table.fontnames)).tolist()
+            decisions.extend(classifier.is_heading(text, size, line_bold[i]) for i, (text, size, _) in enumerate(page))
+        return decisions
+
+    if run_original() != run_compiled():
+        print("MISMATCH between original and compiled classifier")
+        sys.exit(1)
+
+    original = best_of(run_original, args.repeat)
+    compiled = best_of(run_compiled, args.repeat)
+    headings = sum(run_compiled())
+    print(f"{len(lines)} lines, {headings} headings; decisions identical")
+    print(f"original : {original / len(lines) * 1e6:8.2f} us/line")
+    print(f"compiled : {compiled / len(lines) * 1e6:8.2f} us/line")
+    print(f"speedup  : {original / compiled:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
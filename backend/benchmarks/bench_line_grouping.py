@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Compare per-page heading detection: dict-based line grouping vs the columnar CharTable path.
+
+Run from backend/:  python benchmarks/bench_line_grouping.py --pages 20 --lines 80
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.outline_extractor import OutlineExtractor
+
+
+WORDS = ["analysis", "results", "method", "Introduction", "SUMMARY", "data", "the", "of",
+         "Chapter", "performance", "model", "section", "and", "overview", "Conclusion"]
+FONTS = ["Helvetica", "Helvetica-Bold", "Times-Roman", "Times-Bold", "Courier"]
+
+
+def synthetic_page_chars(rng: random.Random, lines: int, chars_per_line: int):
+    """Build pdfplumber-like char dicts for one dense text page"""
+    chars = []
+    for line_no in range(lines):
+        y0 = 780 - line_no * 9.5 + rng.uniform(-0.4, 0.4)
+        heading = rng.random() < 0.08
+        size = rng.choice([14.0, 16.0, 18.0]) if heading else rng.choice([9.0, 10.0, 10.5])
+        font = rng.choice(FONTS[1::2]) if heading else rng.choice(FONTS)
+        if rng.random() < 0.1:
+            text = f"{rng.randint(1, 9)}.{rng.randint(1, 9)} " + rng.choice(WORDS).capitalize()
+        else:
+            text = ' '.join(rng.choice(WORDS) for _ in range(chars_per_line // 7))
+        x = 72.0
+        for ch in text[:chars_per_line]:
+            chars.append({"text": ch, "x0": x, "y0": y0 + rng.uniform(-0.3, 0.3),
+                          "size": size, "fontname": font})
+            x += size * 0.5
+    rng.shuffle(chars)
+    return chars
+
+
+def legacy_page(extractor, chars, page_num):
+    headings = []
+    for line in extractor._group_chars_by_line(chars):
+        heading = extractor._analyze_line_as_heading(line, page_num)
+        if heading:
+            headings.append(heading)
+    return headings
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--lines', type=int, default=80)
+    parser.add_argument('--chars-per-line', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [synthetic_page_chars(rng, args.lines, args.chars_per_line) for _ in range(args.pages)]
+    extractor = OutlineExtractor(page_workers=1)
+
+    for page_num, chars in enumerate(pages, 1):
+        if legacy_page(extractor, chars, page_num) != extractor._page_candidates_columnar(chars, page_num):
+            print(f"MISMATCH on page {page_num}")
+            sys.exit(1)
+
+    legacy = best_of(lambda: [legacy_page(extractor, c, i) for i, c in enumerate(pages, 1)], args.repeat)
+    columnar = best_of(lambda: [extractor._page_candidates_columnar(c, i) for i, c in enumerate(pages, 1)], args.repeat)
+
+    total_chars = sum(len(c) for c in pages)
+    print(f"{args.pages} pages, {total_chars} chars ({total_chars // args.pages} per page); outputs identical")
+    print(f"legacy   : {legacy / args.pages * 1000:8.2f} ms/page")
+    print(f"columnar : {columnar / args.pages * 1000:8.2f} ms/page")
+    print(f"speedup  : {legacy / columnar:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
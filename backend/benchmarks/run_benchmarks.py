@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Benchmark the extraction and ranking hot paths on a synthetic PDF corpus.
+
+Run from backend/:
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --tolerance 0.2
+
+Reports p50/p95/mean latency per stage, pages/sec for full extraction and
+peak RSS as JSON. With --baseline, exits non-zero if any stage's p50 is
+slower than the baseline by more than the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import platform
+from typing import Dict, List, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pdfplumber
+from utils.outline_extractor import OutlineExtractor
+from benchmarks.synthetic_pdf import write_pdf
+
+# Each profile varies page count, text density, font mix and heading density
+PROFILES = {
+    "short-sparse": {"pages": 5, "lines_per_page": 25, "words_per_line": 8, "heading_density": 0.15, "font_mix": 1},
+    "medium-dense": {"pages": 30, "lines_per_page": 60, "words_per_line": 14, "heading_density": 0.05, "font_mix": 2},
+    "long-mixed": {"pages": 120, "lines_per_page": 45, "words_per_line": 12, "heading_density": 0.08, "font_mix": 3},
+}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(fn: Callable, repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "mean_ms": sum(samples) / len(samples) * 1000
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if platform.system() == 'Darwin' else rss / 1024
+
+
+def build_corpus(directory: str, docs_per_profile: int, seed: int) -> Dict[str, List[str]]:
+    corpus = {}
+    for name, spec in PROFILES.items():
+        paths = []
+        for i in range(docs_per_profile):
+            path = os.path.join(directory, f"{name}-{i}.pdf")
+            if not os.path.exists(path):
+                write_pdf(path, spec, seed=seed + i)
+            paths.append(path)
+        corpus[name] = paths
+    return corpus
+
+
+def bench_profile(paths: List[str], spec: Dict, repeat: int) -> Dict[str, Dict]:
+    extractor = OutlineExtractor(page_workers=1)
+    columnar = OutlineExtractor(page_workers=1, columnar=True)
+    legacy = OutlineExtractor(page_workers=1, columnar=False)
+    stages = {}
+
+    def extract_all():
+        for path in paths:
+            extractor.extract_outline(path)
+    stages["extract_outline"] = measure(extract_all, repeat)
+    total_pages = spec["pages"] * len(paths)
+    stages["extract_outline"]["pages_per_sec"] = total_pages / (stages["extract_outline"]["p50_ms"] / 1000)
+
+    # Preload chars so the grouping/classification stages exclude PDF parsing
+    pages_chars = []
+    with pdfplumber.open(paths[0]) as pdf:
+        for page in pdf.pages:
+            pages_chars.append(page.chars)
+            page.flush_cache()
+
+    def group_legacy():
+        for chars in pages_chars:
+            for line in legacy._group_chars_by_line(chars):
+                legacy._analyze_line_as_heading(line, 1)
+    stages["group_and_classify_legacy"] = measure(group_legacy, repeat)
+
+    def group_columnar():
+        for page_num, chars in enumerate(pages_chars, 1):
+            columnar._page_candidates_columnar(chars, page_num)
+    stages["group_and_classify_columnar"] = measure(group_columnar, repeat)
+
+    candidates = [c for page_num, chars in enumerate(pages_chars, 1)
+                  for c in columnar._page_candidates_columnar(chars, page_num)]
+    stages["assign_heading_levels"] = measure(
+        lambda: extractor._assign_heading_levels([dict(c) for c in candidates]), repeat)
+    stages["assign_heading_levels"]["candidates"] = len(candidates)
+    return stages
+
+
+def bench_persona(corpus: Dict[str, List[str]], repeat: int) -> Dict[str, Dict]:
+    try:
+        from utils.persona_analyzer import PersonaAnalyzer, clear_caches
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    extractor = OutlineExtractor(page_workers=1)
+    documents = []
+    for paths in corpus.values():
+        for path in paths:
+            result = extractor.extract_outline(path)
+            result["filename"] = os.path.basename(path)
+            documents.append(result)
+
+    analyzer = PersonaAnalyzer()
+
+    def analyze():
+        return analyzer.analyze_documents_for_persona(documents, "PhD researcher", "summarize the evaluation results")
+
+    def analyze_cold():
+        # Without this every run after the first is a result cache hit
+        clear_caches()
+        analyze()
+
+    cold = measure(analyze_cold, repeat)
+    cold["sections"] = sum(len(d["outline"]) for d in documents)
+    cold["ranking_mode"] = analyzer._ranking_mode()
+    analyze()
+    return {"analyze_documents_for_persona": cold, "analyze_documents_for_persona_warm": measure(analyze, repeat)}
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """List stages whose p50 regressed by more than tolerance versus the baseline"""
+    regressions = []
+    for group, stages in report["results"].items():
+        for stage, stats in stages.items():
+            base = baseline.get("results", {}).get(group, {}).get(stage)
+            if not isinstance(stats, dict) or not isinstance(base, dict) or "p50_ms" not in base:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+            stats["baseline_p50_ms"] = base["p50_ms"]
+            stats["ratio_vs_baseline"] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append(f"{group}/{stage}: p50 {stats['p50_ms']:.2f} ms vs {base['p50_ms']:.2f} ms "
+                                   f"({(ratio - 1) * 100:+.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus-dir', help='where to write/reuse the synthetic PDFs (default: temp dir)')
+    parser.add_argument('--docs-per-profile', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--profiles', nargs='*', choices=sorted(PROFILES), help='subset of profiles to run')
+    parser.add_argument('--skip-persona', action='store_true', help='skip the PersonaAnalyzer stage')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='baseline report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown vs baseline')
+    parser.add_argument('--save-baseline', help='also write this report as a new baseline')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix='pdf-bench-')
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = build_corpus(corpus_dir, args.docs_per_profile, args.seed)
+    if args.profiles:
+        corpus = {name: paths for name, paths in corpus.items() if name in args.profiles}
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "docs_per_profile": args.docs_per_profile,
+            "seed": args.seed,
+            "profiles": {name: PROFILES[name] for name in corpus}
+        },
+        "results": {}
+    }
+    for name, paths in corpus.items():
+        report["results"][name] = bench_profile(paths, PROFILES[name], args.repeat)
+        print(f"{name}: done", file=sys.stderr)
+    if not args.skip_persona:
+        report["results"]["persona"] = bench_persona(corpus, args.repeat)
+    report["meta"]["peak_rss_mb"] = peak_rss_mb()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Deterministic synthetic PDF generator for benchmarks.
+
+Writes plain PDF 1.4 files by hand using the base-14 Type1 fonts, so no
+PDF library is needed and the same spec and seed always yield the same
+bytes.
+"""
+
+import random
+from typing import Dict, List
+
+WORDS = ["analysis", "results", "method", "system", "data", "model", "performance", "the", "of",
+         "and", "to", "in", "design", "evaluation", "network", "study", "approach", "training",
+         "document", "structure", "feature", "value", "report", "process", "review", "section"]
+HEADING_WORDS = ["Introduction", "Background", "Methods", "Results", "Discussion", "Conclusion",
+                 "Overview", "Evaluation", "Implementation", "Related Work", "Appendix", "Summary"]
+
+REGULAR_FONTS = ["Helvetica", "Times-Roman", "Courier"]
+BOLD_FONTS = ["Helvetica-Bold", "Times-Bold", "Courier-Bold"]
+HEADING_SIZES = [18, 15, 13]
+BODY_SIZE = 10
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _heading_text(rng: random.Random, level: int, counters: List[int]) -> str:
+    counters[level] += 1
+    for deeper in range(level + 1, len(counters)):
+        counters[deeper] = 0
+    style = rng.random()
+    word = rng.choice(HEADING_WORDS)
+    if level == 0 and style < 0.3:
+        return f"Chapter {counters[0]} {word}"
+    if level == 0 and style < 0.5:
+        return word.upper()
+    number = '.'.join(str(c) for c in counters[:level + 1])
+    return f"{number} {word}"
+
+
+def _page_stream(rng: random.Random, spec: Dict, font_ids: Dict[str, str], counters: List[int]) -> bytes:
+    ops = []
+    y = 760.0
+    lines = spec["lines_per_page"]
+    leading = (760 - 60) / max(lines, 1)
+    for _ in range(lines):
+        if rng.random() < spec["heading_density"]:
+            level = rng.randrange(len(HEADING_SIZES))
+            size = HEADING_SIZES[level]
+            font = rng.choice(BOLD_FONTS[:spec["font_mix"]])
+            text = _heading_text(rng, level, counters)
+        else:
+            size = BODY_SIZE
+            font = rng.choice(REGULAR_FONTS[:spec["font_mix"]])
+            text = ' '.join(rng.choice(WORDS) for _ in range(spec["words_per_line"]))
+        ops.append(f"BT /{font_ids[font]} {size} Tf 72 {y:.2f} Td ({_escape(text)}) Tj ET")
+        y -= leading
+    return '\n'.join(ops).encode('latin-1')
+
+
+def write_pdf(path: str, spec: Dict, seed: int = 0):
+    """Write one synthetic PDF.
+
+    spec keys: pages, lines_per_page, words_per_line, heading_density
+    (probability that a line is a heading) and font_mix (1-3 font families).
+    """
+    rng = random.Random(seed)
+    fonts = REGULAR_FONTS[:spec["font_mix"]] + BOLD_FONTS[:spec["font_mix"]]
+    font_ids = {font: f"F{i + 1}" for i, font in enumerate(fonts)}
+    counters = [0] * len(HEADING_SIZES)
+
+    objects: List[bytes] = []  # object n is objects[n - 1]
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(b'')
+    pages_id = add(b'')
+    font_refs = ' '.join(f"/{font_ids[font]} {add(f'<< /Type /Font /Subtype /Type1 /BaseFont /{font} >>'.encode())} 0 R"
+                         for font in fonts)
+
+    page_ids = []
+    for page_no in range(spec["pages"]):
+        stream = _page_stream(rng, spec, font_ids, counters)
+        content_id = add(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        page_ids.append(add((f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 792] "
+                             f"/Resources << /Font << {font_refs} >> >> /Contents {content_id} 0 R >>").encode()))
+
+    objects[catalog_id - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode()
+    objects[pages_id - 1] = (f"<< /Type /Pages /Kids [{' '.join(f'{p} 0 R' for p in page_ids)}] "
+                             f"/Count {len(page_ids)} >>").encode()
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref_at = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog_id, xref_at)
+
+    with open(path, 'wb') as f:
+        f.write(bytes(out))
@@ -0,0 +1,10 @@
+import os
+
+
+def post_fork(server, worker):
+    """Load the embedding model once per worker before it accepts requests"""
+    if os.environ.get('PRELOAD_MODEL', '1') != '1':
+        return
+    from utils.model_registry import preload
+    preload()
+    server.log.info(f"Worker {worker.pid}: embedding model preloaded")
@@ -2,21 +2,74 @@
 
 import os
 import sys
+import argparse
 from pdf_processor import PDFProcessor
+from utils.outline_cache import OutlineCache
+from utils.outline_store import OutlineStore
+from utils.process_pool import default_workers
+from utils.dir_watcher import IncrementalIngester
+from utils.embedding_backends import build_idf
 
 def main():
     """Main entry point for Docker container"""
+    parser = argparse.ArgumentParser(description="Extract PDF outlines from the input directory")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and process new or modified PDFs as they appear")
+    parser.add_argument("--full", action="store_true",
+                        help="reprocess every PDF instead of only new or modified ones")
+    parser.add_argument("--settle", type=float, default=float(os.environ.get("WATCH_SETTLE", "2")),
+                        help="seconds a file must stay unchanged before it is processed")
+    parser.add_argument("--poll-interval", type=float, default=float(os.environ.get("WATCH_POLL", "10")),
+                        help="rescan interval when inotify is unavailable")
+    parser.add_argument("--no-json", action="store_true",
+                        help="only write outlines to the outline store, not one JSON file per PDF")
+    parser.add_argument("--export-json", action="store_true",
+                        help="write every stored outline to the output directory as JSON and exit")
+    parser.add_argument("--build-idf", metavar="PATH",
+                        help="write document frequencies of every stored section title to PATH for the "
+                             "hashed-tfidf embedding backend (TFIDF_IDF_PATH) and exit")
+    args = parser.parse_args()
+    
     input_dir = "/app/input"
     output_dir = "/app/output"
+    cache_dir = os.environ.get("CACHE_FOLDER", "/app/cache")
+    workers = int(os.environ.get("PDF_WORKERS", default_workers()))
+    timeout = float(os.environ.get("PDF_TIMEOUT", "0")) or None
     
     print("Starting PDF Outline Extraction...")
     print(f"Input directory: {input_dir}")
     print(f"Output directory: {output_dir}")
     
-    processor = PDFProcessor()
-    processor.process_pdfs(input_dir, output_dir)
+    store = OutlineStore(os.path.join(cache_dir, "outlines.db"))
+    if args.export_json:
+        print(f"Exported {store.export_dir(output_dir)} outlines")
+        return
+    if args.build_idf:
+        titles = [text for _, _, text, _ in store.iter_headings() if text]
+        build_idf(titles, args.build_idf)
+        print(f"Wrote document frequencies of {len(titles)} section titles to {args.build_idf}")
+        return
+    
+    processor = PDFProcessor(cache=OutlineCache(cache_dir), outline_mode=os.environ.get("OUTLINE_MODE", "heuristic"))
+    if args.full:
+        processor.process_pdfs(input_dir, output_dir, workers=workers, timeout=timeout,
+                               store=store, write_json=not args.no_json)
+        print("Processing complete!")
+        return
+    
+    if not os.path.exists(input_dir):
+        print(f"Input directory {input_dir} does not exist")
+        sys.exit(1)
     
-    print("Processing complete!")
+    ingester = IncrementalIngester(processor, input_dir, output_dir, settle_seconds=args.settle,
+                                   poll_interval=args.poll_interval, workers=workers, timeout=timeout,
+                                   store=store, write_json=not args.no_json)
+    if args.watch:
+        ingester.run_forever()
+    else:
+        changes = ingester.sync_once(settle=False)
+        print(f"Processed {len(changes['processed'])}, removed {len(changes['removed'])}")
+        print("Processing complete!")
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,65 @@
 import os
 import json
-from utils.outline_extractor import OutlineExtractor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from utils.outline_extractor import OutlineExtractor, extract_outline_in_worker, without_section_text
+from utils.outline_cache import OutlineCache
+from utils.process_pool import run_in_processes, in_index_order, default_workers
+from utils import metrics
 
 class PDFProcessor:
-    def __init__(self):
-        self.extractor = OutlineExtractor()
+    def __init__(self, cache=None, outline_mode: str = "heuristic"):
+        self.extractor = OutlineExtractor(cache=cache, outline_mode=outline_mode)
         
-    def process_pdfs(self, input_dir: str, output_dir: str):
-        """Process all PDFs in input directory"""
+    def extract_many(self, pdf_paths: List[str], workers: int = 1, timeout: Optional[float] = None,
+                     ordered: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Extract outlines for several PDFs, yielding (path, result) pairs.
+
+        Cached outlines never reach a worker. With workers > 1 the remaining
+        files are parsed in a process pool; a file that times out or crashes
+        its worker yields a failed result instead of aborting the batch.
+        The timeout only applies to pool workers.
+        """
+        results = self._extract_as_completed(pdf_paths, workers, timeout)
+        if ordered:
+            results = in_index_order(results)
+        for _, pdf_path, result in results:
+            yield pdf_path, result
+        
+    def _extract_as_completed(self, pdf_paths, workers, timeout):
+        pending = []
+        for index, pdf_path in enumerate(pdf_paths):
+            key, cached = self.extractor.lookup_cached(pdf_path)
+            if cached is not None:
+                yield index, pdf_path, cached
+            else:
+                pending.append((index, pdf_path, key))
+        
+        if workers <= 1 or len(pending) <= 1:
+            for index, pdf_path, key in pending:
+                result = self.extractor._extract_outline_uncached(pdf_path)
+                self.extractor.store_cached(key, result)
+                yield index, pdf_path, result
+            return
+        
+        options = self.extractor.worker_options()
+        args_list = [(pdf_path, options) for _, pdf_path, _ in pending]
+        for task_index, result, error in run_in_processes(extract_outline_in_worker, args_list, workers=workers,
+                                                          timeout=timeout, ordered=False):
+            index, pdf_path, key = pending[task_index]
+            if error is not None:
+                result = OutlineExtractor.failed_result(error)
+                metrics.count('extract_failures')
+            else:
+                # Worker-side counters stay in the worker, so count the result here
+                metrics.count('documents')
+                metrics.count('pages', result.get("total_pages", 0))
+                metrics.count('sections', len(result.get("outline", [])))
+            self.extractor.store_cached(key, result)
+            yield index, pdf_path, result
+        
+    def process_pdfs(self, input_dir: str, output_dir: str, workers: int = 1, timeout: Optional[float] = None,
+                     ordered: bool = True, store=None, write_json: bool = True):
+        """Process all PDFs in input directory, writing JSON files and/or into an OutlineStore"""
         if not os.path.exists(input_dir):
             print(f"Input directory {input_dir} does not exist")
             return
@@ -16,21 +68,29 @@ class PDFProcessor:
             os.makedirs(output_dir)
         
         pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.pdf')]
+        pdf_paths = [os.path.join(input_dir, pdf_file) for pdf_file in pdf_files]
+        
+        print(f"Processing {len(pdf_paths)} PDFs with {workers} worker(s)...")
         
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(input_dir, pdf_file)
+        for pdf_path, result in self.extract_many(pdf_paths, workers=workers, timeout=timeout, ordered=ordered):
+            pdf_file = os.path.basename(pdf_path)
             output_file = os.path.splitext(pdf_file)[0] + '.json'
             output_path = os.path.join(output_dir, output_file)
             
-            print(f"Processing {pdf_file}...")
+            if not result.get("success"):
+                print(f"Failed to process {pdf_file}: {result.get('error')}")
             
-            result = self.extractor.extract_outline(pdf_path)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
+            if store is not None:
+                store.put(pdf_file, result)
+            if write_json:
+                with metrics.stage('write_json'), open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(without_section_text(result), f, indent=2, ensure_ascii=False)
             
             print(f"Saved outline to {output_file}")
+        
+        if self.extractor.cache is not None:
+            print(f"Outline cache: {self.extractor.cache.stats()}")
 
 if __name__ == "__main__":
-    processor = PDFProcessor()
-    processor.process_pdfs("/app/input", "/app/output")
+    processor = PDFProcessor(cache=OutlineCache(os.environ.get("CACHE_FOLDER", "/app/cache")))
+    processor.process_pdfs("/app/input", "/app/output", workers=default_workers())
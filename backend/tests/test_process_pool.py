@@ -0,0 +1,41 @@
+"""Run from backend/:  python -m pytest tests"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pdf_processor import PDFProcessor
+from utils.outline_cache import OutlineCache
+from utils.process_pool import run_in_processes, TaskTimeout
+from benchmarks.synthetic_pdf import write_pdf
+
+SLOW_DOCUMENT = {"pages": 120, "lines_per_page": 45, "words_per_line": 12, "heading_density": 0.08, "font_mix": 3}
+
+
+def test_slow_function_times_out():
+    (index, result, error), = run_in_processes(time.sleep, [(5,)], workers=1, timeout=0.2)
+    assert isinstance(error, TaskTimeout)
+
+
+def test_slow_document_fails_and_is_not_cached(tmp_path):
+    paths = []
+    for seed in range(2):
+        path = str(tmp_path / f"slow{seed}.pdf")
+        write_pdf(path, SLOW_DOCUMENT, seed=seed)
+        paths.append(path)
+    cache = OutlineCache(str(tmp_path / "cache"))
+    processor = PDFProcessor(cache=cache, outline_mode="heuristic")
+
+    started = time.perf_counter()
+    results = dict(processor.extract_many(paths, workers=2, timeout=0.2))
+    elapsed = time.perf_counter() - started
+
+    # Extraction swallows per-page errors, but a timeout must fail the whole document
+    for path in paths:
+        assert results[path]["success"] is False
+        assert "timed out" in results[path]["error"]
+        assert results[path]["outline"] == []
+    assert cache.stats()["entries"] == 0
+    assert elapsed < 30
@@ -0,0 +1,123 @@
+import time
+import queue
+import threading
+from typing import List, Dict, Any
+import numpy as np
+
+
+class _EncodeRequest:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingEncoder:
+    """Coalesces concurrent encode() calls into batched model forward passes.
+
+    Callers block in encode() while a single background thread gathers
+    requests for up to max_latency_ms (or until max_batch_size texts are
+    waiting), runs one model.encode over all of them and hands each caller
+    its slice of the result.
+    """
+
+    def __init__(self, model, max_batch_size: int = 64, max_latency_ms: float = 5):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.encode_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.largest_batch = 0
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts, sharing a forward pass with concurrent callers"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        self._ensure_started()
+        request = _EncodeRequest(texts)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='batch-encoder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0].texts)
+            deadline = time.perf_counter() + self.max_latency
+
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request.texts)
+
+            self._process(batch, size)
+
+    def _process(self, batch: List[_EncodeRequest], size: int):
+        all_texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+        try:
+            embeddings = np.asarray(self.model.encode(all_texts, batch_size=self.max_batch_size))
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        finished = time.perf_counter()
+
+        offset = 0
+        for request in batch:
+            request.result = embeddings[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+            request.done.set()
+
+        with self._stats_lock:
+            self.requests += len(batch)
+            self.texts += size
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, size)
+            self.encode_seconds += finished - started
+            self.wait_seconds += sum(started - request.enqueued_at for request in batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batching and throughput counters since start"""
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "texts": self.texts,
+                "batches": self.batches,
+                "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "texts_per_second": self.texts / self.encode_seconds if self.encode_seconds else 0.0,
+                "avg_queue_wait_ms": 1000 * self.wait_seconds / self.requests if self.requests else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_latency_ms": self.max_latency * 1000
+            }
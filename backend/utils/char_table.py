@@ -0,0 +1,70 @@
+from typing import List, Dict, Iterator, Tuple
+from operator import itemgetter
+import numpy as np
+
+_TEXT_FIELD = itemgetter('text')
+_FONT_FIELD = itemgetter('fontname')
+
+
+class CharTable:
+    """Columnar view of a page's chars, grouped into lines with NumPy.
+
+    Produces the same lines, in the same order, as
+    OutlineExtractor._group_chars_by_line: chars sorted top-to-bottom then
+    left-to-right, with a new line whenever consecutive y0 values differ by
+    more than y_tolerance.
+    """
+
+    def __init__(self, chars: List[Dict], y_tolerance: float = 2):
+        n = len(chars)
+        try:
+            y0, x0, size = (np.fromiter(map(itemgetter(field), chars), dtype=np.float64, count=n)
+                            for field in ('y0', 'x0', 'size'))
+            texts = list(map(_TEXT_FIELD, chars))
+            fontnames = list(map(_FONT_FIELD, chars))
+        except KeyError:
+            # Same defaults as the dict-based path for chars missing a field
+            y0, x0, size = (np.fromiter((c.get(field, 0) for c in chars), dtype=np.float64, count=n)
+                            for field in ('y0', 'x0', 'size'))
+            texts = [c.get('text', '') for c in chars]
+            fontnames = [c.get('fontname', '') for c in chars]
+
+        # Stable sort on (-y0, x0), matching Python's sorted() on the same key
+        order = np.lexsort((x0, -y0))
+        order_list = order.tolist()
+
+        self.fontnames = list(dict.fromkeys(fontnames))
+        font_index = {name: i for i, name in enumerate(self.fontnames)}
+        codes = np.fromiter(map(font_index.__getitem__, fontnames), dtype=np.int32, count=n)
+
+        self.order = order
+        self.texts = [texts[i] for i in order_list]
+        self.sizes = size[order].tolist()
+        self.font_codes = codes[order]
+
+        ys = y0[order]
+        breaks = np.flatnonzero(np.abs(np.diff(ys)) > y_tolerance) + 1
+        self.line_starts = np.concatenate(([0], breaks)).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+        self.line_ends = np.concatenate((breaks, [n])).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.line_starts)
+
+    def line_flags(self, font_flags: Dict[str, bool]) -> np.ndarray:
+        """Per-line OR of a per-fontname boolean (e.g. 'is bold')"""
+        if not len(self.line_starts):
+            return np.zeros(0, dtype=bool)
+        per_font = np.array([font_flags[name] for name in self.fontnames], dtype=bool)
+        return np.logical_or.reduceat(per_font[self.font_codes], self.line_starts)
+
+    def iter_lines(self) -> Iterator[Tuple[int, str, float]]:
+        """Yield (line index, stripped text, average font size) per line.
+
+        The average is summed sequentially in Python rather than with
+        np.add.reduceat so it is bit-identical to the row-wise implementation.
+        """
+        texts = self.texts
+        sizes = self.sizes
+        for index, (start, end) in enumerate(zip(self.line_starts.tolist(), self.line_ends.tolist())):
+            text = ''.join(texts[start:end]).strip()
+            yield index, text, sum(sizes[start:end]) / (end - start)
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from typing import Dict, Any, List, Optional, Set
+
+from utils.outline_cache import file_sha256
+from utils.outline_extractor import without_section_text
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Minimal ctypes binding to Linux inotify for a single directory"""
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self._fd, directory.encode(), self.MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, f'inotify_add_watch failed for {directory}')
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        """Block up to timeout seconds; return the names of changed entries"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        names = set()
+        if not ready:
+            return names
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return names
+            raise
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            names.add(data[offset:offset + length].rstrip(b'\0').decode(errors='replace'))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Fallback watcher that simply sleeps; every wakeup triggers a rescan"""
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+def make_watcher(directory: str):
+    """inotify on Linux, polling everywhere else or if inotify is unavailable"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher()
+
+
+class IncrementalIngester:
+    """Keeps output_dir in sync with the PDFs in input_dir.
+
+    A manifest in output_dir records mtime/size/hash of every processed
+    input, so only new or modified files are extracted. A file is only
+    picked up once its size and mtime have been stable for settle_seconds,
+    which skips uploads that are still being written. Outputs of deleted
+    inputs are removed. With an OutlineStore, results are also written to
+    (and deleted from) the store; write_json=False skips the per-PDF JSON.
+    """
+
+    MANIFEST_NAME = '.ingest_manifest.json'
+
+    def __init__(self, processor, input_dir: str, output_dir: str, settle_seconds: float = 2.0,
+                 poll_interval: float = 10.0, workers: int = 1, timeout: Optional[float] = None,
+                 store=None, write_json: bool = True):
+        self.processor = processor
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.timeout = timeout
+        self.store = store
+        self.write_json = write_json
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest_path = os.path.join(output_dir, self.MANIFEST_NAME)
+        self.manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
+        self._unsettled: Dict[str, tuple] = {}  # name -> (size, mtime_ns) last seen
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _output_name(self, pdf_file: str) -> str:
+        return os.path.splitext(pdf_file)[0] + '.json'
+
+    def _output_exists(self, name: str, output_name: str) -> bool:
+        if self.write_json and not os.path.exists(os.path.join(self.output_dir, output_name)):
+            return False
+        return self.store is None or name in self.store
+
+    def sync_once(self, settle: bool = True) -> Dict[str, List[str]]:
+        """Process new/changed inputs and drop outputs of deleted ones"""
+        changes = {"processed": [], "removed": [], "waiting": []}
+        now = time.time()
+
+        current = {}
+        for entry in os.scandir(self.input_dir):
+            if entry.is_file() and entry.name.lower().endswith('.pdf'):
+                st = entry.stat()
+                current[entry.name] = (st.st_size, st.st_mtime_ns)
+
+        ready = []
+        for name, stamp in current.items():
+            known = self.manifest.get(name)
+            if known and (known["size"], known["mtime_ns"]) == stamp:
+                continue
+            if settle:
+                # Must look the same on two consecutive scans and be settle_seconds old
+                stable = self._unsettled.get(name) == stamp
+                old_enough = now - stamp[1] / 1e9 >= self.settle_seconds
+                if not (stable and old_enough):
+                    self._unsettled[name] = stamp
+                    changes["waiting"].append(name)
+                    continue
+            self._unsettled.pop(name, None)
+            ready.append(name)
+
+        dirty = False
+        to_extract = []
+        for name in ready:
+            path = os.path.join(self.input_dir, name)
+            try:
+                digest = file_sha256(path)
+            except OSError:
+                continue
+            known = self.manifest.get(name)
+            size, mtime_ns = current[name]
+            if known and known["sha256"] == digest and self._output_exists(name, known["output"]):
+                # Touched but not modified
+                known.update(size=size, mtime_ns=mtime_ns)
+                dirty = True
+                continue
+            to_extract.append((name, path, size, mtime_ns, digest))
+
+        paths = [path for _, path, _, _, _ in to_extract]
+        for (name, _, size, mtime_ns, digest), (_, result) in zip(
+                to_extract, self.processor.extract_many(paths, workers=self.workers, timeout=self.timeout)):
+            output_name = self._output_name(name)
+            if self.store is not None:
+                self.store.put(name, result)
+            if self.write_json:
+                with open(os.path.join(self.output_dir, output_name), 'w', encoding='utf-8') as f:
+                    json.dump(without_section_text(result), f, indent=2, ensure_ascii=False)
+            # Failed files are recorded too; a re-upload changes size/mtime and is retried
+            self.manifest[name] = {"size": size, "mtime_ns": mtime_ns, "sha256": digest, "output": output_name,
+                                   "success": bool(result.get("success"))}
+            if not result.get("success"):
+                print(f"Failed to process {name}: {result.get('error')}")
+            changes["processed"].append(name)
+            print(f"Saved outline to {output_name}" if self.write_json else f"Stored outline for {name}")
+            if len(changes["processed"]) % 50 == 0:
+                # Checkpoint long batches so an interrupted run does not start over
+                self._save_manifest()
+
+        for name in [n for n in self.manifest if n not in current]:
+            try:
+                os.remove(os.path.join(self.output_dir, self.manifest[name]["output"]))
+            except OSError:
+                pass
+            if self.store is not None:
+                self.store.remove(name)
+            del self.manifest[name]
+            changes["removed"].append(name)
+            print(f"Removed outline for deleted {name}")
+
+        for name in [n for n in self._unsettled if n not in current]:
+            del self._unsettled[name]
+
+        if dirty or changes["processed"] or changes["removed"]:
+            self._save_manifest()
+        return changes
+
+    def run_forever(self):
+        """Watch input_dir and sync whenever it changes"""
+        watcher = make_watcher(self.input_dir)
+        print(f"Watching {self.input_dir} ({type(watcher).__name__})")
+        try:
+            changes = self.sync_once()
+            while True:
+                # Re-check soon while uploads are settling, otherwise wait for events
+                timeout = self.settle_seconds if changes["waiting"] else self.poll_interval
+                events = watcher.wait(timeout)
+                if events is not None and not events and not changes["waiting"]:
+                    continue
+                changes = self.sync_once()
+        finally:
+            watcher.close()
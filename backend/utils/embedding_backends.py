@@ -0,0 +1,242 @@
+import os
+import io
+import abc
+import json
+import math
+import time
+import zlib
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+from utils.embedding_store import l2_normalize
+from utils.section_ranking import tokenize
+
+# EMBEDDING_BACKEND values; the first is the default
+BACKENDS = ('sentence-transformer', 'quantized', 'hashed-tfidf')
+
+
+def _rss_bytes() -> int:
+    """Resident set size of this process, or 0 where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class EmbeddingBackend(abc.ABC):
+    """Text -> vector model with load cost and throughput counters.
+
+    Subclasses implement _load(), _encode(texts, batch_size) and
+    model_bytes(); encode() accepts the same arguments as
+    SentenceTransformer.encode.
+    """
+
+    name = ''
+    # Worth coalescing concurrent calls through a BatchingEncoder
+    batched = True
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.texts = 0
+        self.encode_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        self._load()
+        self.load_seconds = time.perf_counter() - started
+        self.load_rss_bytes = max(_rss_bytes() - rss_before, 0)
+        self.model_size = self.model_bytes()
+        self.dim = int(self._encode(['dimension probe'], 1).shape[1])
+
+    @abc.abstractmethod
+    def _load(self):
+        """Load the model (called once, from __init__)"""
+
+    @abc.abstractmethod
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Vectors of a non-empty list of texts"""
+
+    @abc.abstractmethod
+    def model_bytes(self) -> int:
+        """Size of the loaded model's weights"""
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        texts = list(texts)
+        started = time.perf_counter()
+        vectors = self._encode(texts, batch_size) if texts else np.zeros((0, self.dim), dtype=np.float32)
+        with self._stats_lock:
+            self.texts += len(texts)
+            self.encode_seconds += time.perf_counter() - started
+        return vectors
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "backend": self.name,
+                "model": self.model_name,
+                "dim": self.dim,
+                "load_seconds": self.load_seconds,
+                "load_rss_bytes": self.load_rss_bytes,
+                "model_bytes": self.model_size,
+                "texts": self.texts,
+                "texts_per_second": self.texts / self.encode_seconds if self.encode_seconds else 0.0
+            }
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """The full-precision PyTorch SentenceTransformer"""
+
+    name = 'sentence-transformer'
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(self.model_name, device='cpu')
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=batch_size))
+
+    def model_bytes(self) -> int:
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class QuantizedBackend(SentenceTransformerBackend):
+    """The same model with Linear layers dynamically quantized to int8.
+
+    Weights shrink about 4x and CPU matmuls run in int8; vectors are close
+    to, but not identical with, the full-precision ones.
+    """
+
+    name = 'quantized'
+
+    def _load(self):
+        import torch
+        super()._load()
+        engines = torch.backends.quantized.supported_engines
+        if 'fbgemm' not in engines and 'qnnpack' in engines:
+            torch.backends.quantized.engine = 'qnnpack'  # ARM
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def model_bytes(self) -> int:
+        # Packed int8 weights are not parameters or buffers, so measure the serialized state
+        import torch
+        buffer = io.BytesIO()
+        torch.save(self.model.state_dict(), buffer)
+        return buffer.tell()
+
+
+class HashedTfidfBackend(EmbeddingBackend):
+    """Signed feature hashing of word unigrams and bigrams into dim buckets.
+
+    Weights are (1 + log tf) * idf, with idf read from an optional JSON file
+    ({"documents": N, "df": {term: count}}, written by `main.py --build-idf`)
+    and 1 otherwise.
+    No model is loaded; only lexical overlap is captured.
+    """
+
+    name = 'hashed-tfidf'
+    batched = False
+
+    def __init__(self, model_name: str, dim: int = 384, idf_path: Optional[str] = None):
+        self._dim = dim
+        self.idf_path = idf_path
+        super().__init__(model_name)
+
+    def _load(self):
+        self.idf: Dict[str, float] = {}
+        if self.idf_path:
+            with open(self.idf_path, 'rb') as f:
+                table = json.load(f)
+            documents = table["documents"]
+            self.idf = {term: math.log((1 + documents) / (1 + df)) + 1 for term, df in table["df"].items()}
+        self._buckets: Dict[str, int] = {}
+
+    def _bucket(self, term: str) -> int:
+        """Signed bucket: index + 1, negated for the minus sign (crc32 is stable across processes)"""
+        bucket = self._buckets.get(term)
+        if bucket is None:
+            h = zlib.crc32(term.encode('utf-8'))
+            bucket = (h % self._dim + 1) * (-1 if h & 0x80000000 else 1)
+            if len(self._buckets) < 500000:
+                self._buckets[term] = bucket
+        return bucket
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        rows, columns, weights = [], [], []
+        for row, text in enumerate(texts):
+            for term, tf in _terms(text).items():
+                bucket = self._bucket(term)
+                rows.append(row)
+                columns.append(abs(bucket) - 1)
+                weights.append(math.copysign((1 + math.log(tf)) * self.idf.get(term, 1.0), bucket))
+        vectors = np.zeros((len(texts), self._dim), dtype=np.float32)
+        np.add.at(vectors, (np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)),
+                  np.asarray(weights, dtype=np.float32))
+        return l2_normalize(vectors)
+
+    def model_bytes(self) -> int:
+        # Rough size of the idf table; the hashing itself has no parameters
+        return sum(len(term) + 8 for term in self.idf)
+
+
+def _terms(text: str) -> Counter:
+    words = tokenize(text)
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def build_idf(texts: List[str], path: str):
+    """Write document frequencies of texts (e.g. every section title) for HashedTfidfBackend"""
+    df = Counter()
+    for text in texts:
+        df.update(set(_terms(text)))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"documents": len(texts), "df": dict(df)}, f, ensure_ascii=False)
+
+
+def _tfidf_config():
+    return int(os.environ.get('TFIDF_DIM', '384')), os.environ.get('TFIDF_IDF_PATH') or None
+
+
+_backend_ids: Dict[Tuple[str, str], str] = {}
+
+
+def backend_id(backend: str, model_name: str) -> str:
+    """Identity of a backend's vector space, used to keep embedding stores and indexes apart.
+
+    Computed once per process, like the loaded backend it describes.
+    """
+    key = (backend, model_name)
+    if key not in _backend_ids:
+        _backend_ids[key] = _backend_id(backend, model_name)
+    return _backend_ids[key]
+
+
+def _backend_id(backend: str, model_name: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+    if backend == 'sentence-transformer':
+        # Unsuffixed, so stores built before backends existed stay valid
+        return model_name
+    if backend == 'hashed-tfidf':
+        dim, idf_path = _tfidf_config()
+        if idf_path:
+            with open(idf_path, 'rb') as f:
+                return f"hashed-tfidf-{dim}-{zlib.crc32(f.read()):08x}"
+        return f"hashed-tfidf-{dim}"
+    return f"{model_name}@{backend}"
+
+
+def load_backend(backend: str, model_name: str) -> EmbeddingBackend:
+    """Instantiate a backend by its EMBEDDING_BACKEND name"""
+    if backend == 'sentence-transformer':
+        return SentenceTransformerBackend(model_name)
+    if backend == 'quantized':
+        return QuantizedBackend(model_name)
+    if backend == 'hashed-tfidf':
+        dim, idf_path = _tfidf_config()
+        return HashedTfidfBackend(model_name, dim=dim, idf_path=idf_path)
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
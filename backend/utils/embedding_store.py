@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import threading
+import unicodedata
+from typing import List, Dict, Callable
+import numpy as np
+
+
+# Keys are fixed-width sha1 hex digests plus a newline
+KEY_RECORD_SIZE = 41
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for embedding cache keys"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text or '')).strip()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingStore:
+    """On-disk store of unit-length text embeddings for one model.
+
+    Rows live in a memory-mapped float32 matrix (vectors.f32) and row order is
+    recorded in an append-only key file (keys.txt), one text hash per line.
+    Appends are serialised across processes with an flock on a lock file.
+    """
+
+    def __init__(self, store_dir: str, model_name: str):
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.directory = os.path.join(store_dir, safe_name)
+        self.model_name = model_name
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self._keys_path = os.path.join(self.directory, 'keys.txt')
+        self._meta_path = os.path.join(self.directory, 'meta.json')
+        self._lock_path = os.path.join(self.directory, '.lock')
+
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._matrix = None
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        """Sync the in-memory index and memmap with what is on disk"""
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+        if self.dim is None:
+            return
+
+        # Only the tail written since the last reload needs parsing
+        known = len(self._rows)
+        keys_size = os.path.getsize(self._keys_path) if os.path.exists(self._keys_path) else 0
+        new_keys = []
+        if keys_size > known * KEY_RECORD_SIZE:
+            with open(self._keys_path, 'rb') as f:
+                f.seek(known * KEY_RECORD_SIZE)
+                tail = f.read()
+            new_keys = tail.decode('ascii').split('\n')[:len(tail) // KEY_RECORD_SIZE]
+
+        # A crash between the two appends can leave one file longer; trust the shorter
+        stored_rows = os.path.getsize(self._vectors_path) // (4 * self.dim) if os.path.exists(self._vectors_path) else 0
+        count = min(known + len(new_keys), stored_rows)
+
+        for row, key in enumerate(new_keys[:count - known], start=known):
+            self._rows[key] = row
+        if count:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(count, self.dim))
+        else:
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_embeddings(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return unit-length embeddings for texts, encoding only cache misses"""
+        keys = [text_key(t) for t in texts]
+
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+        # Encode without the lock so concurrent callers can be batched together;
+        # _append skips rows another caller stored in the meantime
+        if missing:
+            vectors = l2_normalize(encode_fn(list(missing.values())))
+
+        with self._lock:
+            if missing:
+                self._append(list(missing.keys()), vectors)
+
+            rows = np.fromiter((self._rows[k] for k in keys), dtype=np.int64, count=len(keys))
+            if self.dim is None:
+                return np.zeros((0, 0), dtype=np.float32)
+            return np.asarray(self._matrix[rows])
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self.dim is None:
+                    if not os.path.exists(self._meta_path):
+                        with open(self._meta_path, 'w', encoding='utf-8') as f:
+                            json.dump({"model": self.model_name, "dim": int(vectors.shape[1])}, f)
+                self._reload()
+
+                # Another worker may have stored some of these while we were encoding
+                fresh = [i for i, key in enumerate(keys) if key not in self._rows]
+                if fresh:
+                    count = len(self._rows)
+                    with open(self._vectors_path, 'ab') as f:
+                        f.truncate(count * 4 * self.dim)
+                        f.write(np.ascontiguousarray(vectors[fresh], dtype=np.float32).tobytes())
+                    with open(self._keys_path, 'ab') as f:
+                        f.truncate(count * KEY_RECORD_SIZE)
+                        f.write(''.join(keys[i] + '\n' for i in fresh).encode('ascii'))
+                    self._reload()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"rows": len(self._rows), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,97 @@
+import os
+import re
+import json
+import hashlib
+from typing import Dict, Any, List, Optional
+
+# Default rules reproduce the original hard-coded heading heuristics
+DEFAULT_RULES: Dict[str, Any] = {
+    "patterns": [
+        r'^\d+\.?\s+[A-Z]',  # Numbered headings
+        r'^[A-Z][A-Z\s]{2,}$',  # All caps
+        r'^[A-Z][a-z\s]+:?$',  # Title case
+        r'^\d+\.\d+',  # Subsection numbers
+    ],
+    # Words that introduce numbered divisions, e.g. "Chapter 3"
+    "section_words": ["Chapter", "Section", "Part"],
+    # Appended to the patterns, e.g. roman numerals or "Annex A" for a corpus
+    "extra_patterns": [],
+    "ignore_case": False,
+    # Lines with an average font size above this are headings
+    "min_font_size": 12,
+    # A fontname containing any of these (case-insensitive) counts as bold
+    "bold_markers": ["bold"],
+    "min_length": 3,
+    "max_length": 200,
+    "bold_max_length": 100,
+}
+
+
+def load_rules(path: Optional[str] = None) -> Dict[str, Any]:
+    """Default rules overlaid with a JSON rules file (path or $HEADING_RULES)"""
+    rules = dict(DEFAULT_RULES)
+    path = path or os.environ.get('HEADING_RULES')
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_RULES)
+        if unknown:
+            raise ValueError(f"Unknown heading rule keys in {path}: {sorted(unknown)}")
+        rules.update(overrides)
+    return rules
+
+
+def rules_fingerprint(rules: Dict[str, Any]) -> str:
+    """Short stable hash of a rule set, for cache keys"""
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class HeadingClassifier:
+    """Heading rules compiled once: all text patterns become one alternation.
+
+    Bold decisions are cached per fontname; call new_document() between
+    documents so the cache stays small.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Any]] = None):
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        patterns: List[str] = list(self.rules["patterns"])
+        if self.rules["section_words"]:
+            words = '|'.join(re.escape(word) for word in self.rules["section_words"])
+            patterns.append(rf'^({words})\s+\d+')
+        patterns.extend(self.rules["extra_patterns"])
+
+        flags = re.IGNORECASE if self.rules["ignore_case"] else 0
+        # re.match on the alternation succeeds iff re.match succeeds on one of the patterns
+        self._matcher = re.compile('|'.join(f'(?:{p})' for p in patterns), flags).match if patterns else None
+        self._bold_markers = tuple(marker.lower() for marker in self.rules["bold_markers"])
+        self.min_font_size = self.rules["min_font_size"]
+        self.min_length = self.rules["min_length"]
+        self.max_length = self.rules["max_length"]
+        self.bold_max_length = self.rules["bold_max_length"]
+        self._font_styles: Dict[str, bool] = {}
+
+    def new_document(self):
+        self._font_styles = {}
+
+    def is_bold(self, fontname: str) -> bool:
+        bold = self._font_styles.get(fontname)
+        if bold is None:
+            lowered = fontname.lower()
+            bold = self._font_styles[fontname] = any(marker in lowered for marker in self._bold_markers)
+        return bold
+
+    def bold_fonts(self, fontnames: List[str]) -> Dict[str, bool]:
+        return {name: self.is_bold(name) for name in fontnames}
+
+    def matches_pattern(self, text: str) -> bool:
+        return self._matcher is not None and self._matcher(text) is not None
+
+    def is_heading(self, text: str, font_size: float, bold: bool) -> bool:
+        """Classify one stripped line; cheap checks run before the regex"""
+        length = len(text)
+        if length < self.min_length or length > self.max_length:
+            return False
+        return (font_size > self.min_font_size
+                or (bold and length < self.bold_max_length)
+                or self.matches_pattern(text))
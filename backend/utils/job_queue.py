@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = {DONE, FAILED, CANCELLED}
+
+
+class JobCancelled(Exception):
+    """Raised from Job.check_cancelled() once a cancel has been requested"""
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when max_pending jobs are already waiting"""
+
+
+class Job:
+    """One unit of background work with per-document progress"""
+
+    def __init__(self, queue: 'JobQueue', job_id: str, kind: str, documents: List[str]):
+        self._queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.documents = {name: 'pending' for name in documents}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.result = None
+        self.cancel_event = threading.Event()
+        self.finished_event = threading.Event()
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        self._queue._save(self)
+
+    def set_document_status(self, name: str, status: str):
+        self.documents[name] = status
+        self._queue._save(self)
+
+    def is_cancelled(self) -> bool:
+        if not self.cancel_event.is_set() and os.path.exists(self._queue._cancel_marker(self.id)):
+            # Cancel requested through another process sharing the state directory
+            self.cancel_event.set()
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def to_dict(self) -> Dict[str, Any]:
+        done = sum(1 for s in self.documents.values() if s not in ('pending', 'extracting'))
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {
+                "documents": dict(self.documents),
+                "completed": done,
+                "total": len(self.documents)
+            },
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+
+class JobQueue:
+    """Bounded in-process job queue with job state mirrored to local disk.
+
+    Status and results are written under state_dir so that any process
+    sharing the directory (e.g. another gunicorn worker) can answer status,
+    result and cancel requests for jobs it is not running itself.
+    """
+
+    def __init__(self, state_dir: str, max_workers: int = 2, max_pending: int = 50, job_ttl: float = 24 * 3600):
+        self.state_dir = state_dir
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        os.makedirs(state_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.status.json")
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.result.json")
+
+    def _cancel_marker(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.cancel")
+
+    def _write_json(self, path: str, data: Dict[str, Any]):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, job: Job):
+        self._write_json(self._status_path(job.id), job.to_dict())
+
+    def submit(self, kind: str, documents: List[str], fn: Callable[[Job], Dict[str, Any]]) -> Job:
+        """Queue fn(job) for execution and return the job immediately"""
+        self._prune()
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} jobs already queued")
+            job = Job(self, uuid.uuid4().hex, kind, documents)
+            self._jobs[job.id] = job
+        self._save(job)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Dict[str, Any]]):
+        if job.is_cancelled():
+            self._finish(job, CANCELLED)
+            return
+
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._save(job)
+        try:
+            result = fn(job)
+            job.check_cancelled()
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            self._finish(job, FAILED, error=str(e))
+        else:
+            self._write_json(self._result_path(job.id), result)
+            self._finish(job, DONE)
+
+    def _finish(self, job: Job, status: str, error: str = None):
+        job.status = status
+        job.stage = status
+        job.error = error
+        job.finished_at = time.time()
+        self._save(job)
+        job.finished_event.set()
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self._read_json(self._status_path(job_id))
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until a job run by this process finishes (or timeout passes); returns its status"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.finished_event.wait(timeout)
+        return self.status(job_id)
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._read_json(self._result_path(job_id))
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Request cancellation; running jobs stop at their next checkpoint"""
+        status = self.status(job_id)
+        if status is None or status["status"] in FINISHED_STATES:
+            return status
+
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel_event.set()
+        else:
+            open(self._cancel_marker(job_id), 'w').close()
+        status["cancel_requested"] = True
+        return status
+
+    def _prune(self):
+        """Forget finished jobs older than job_ttl, in memory and on disk"""
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.status in FINISHED_STATES and job.finished_at < cutoff:
+                    del self._jobs[job_id]
+
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,192 @@
+"""Per-stage timing, counters and optional tracemalloc accounting.
+
+Stages and counters are aggregated process-wide and rendered in the
+Prometheus text format. Inside collect() the same measurements are also
+recorded for the current request so they can be returned with it.
+
+METRICS_ENABLED=0 turns stage() into a shared no-op context manager and
+count() into an early return. METRICS_TRACEMALLOC=1 starts tracemalloc and
+records the net allocation of every stage; it is expensive, so it is meant
+for debugging rather than for production.
+
+Workers in a process pool record into their own registry, which is not
+merged back, so only in-process stages appear in the breakdown. Every
+series carries a worker="<pid>" label: each gunicorn worker answers
+/metrics from its own registry, and the label keeps scrapes that land on
+different workers apart (sum over it to aggregate).
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+import contextvars
+from typing import Dict, Any, List, Optional
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+TRACEMALLOC = ENABLED and os.environ.get('METRICS_TRACEMALLOC', '0') == '1'
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_stages: Dict[str, Dict[str, Any]] = {}
+_counters: Dict[str, float] = {}
+_request: contextvars.ContextVar = contextvars.ContextVar('metrics_request', default=None)
+
+if TRACEMALLOC:
+    tracemalloc.start()
+
+
+class RequestTimings:
+    """Stage durations and counters recorded while a collect() block is active"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+
+    def _add_stage(self, name: str, seconds: float, memory: Optional[int]):
+        entry = self.stages.setdefault(name, {"calls": 0, "ms": 0.0})
+        entry["calls"] += 1
+        entry["ms"] += seconds * 1000
+        if memory is not None:
+            entry["memory_delta_bytes"] = entry.get("memory_delta_bytes", 0) + memory
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": (time.perf_counter() - self.started) * 1000,
+            "stages": self.stages,
+            "counters": self.counters
+        }
+
+
+class _Stage:
+    __slots__ = ('name', 'start', 'memory')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.memory = tracemalloc.get_traced_memory()[0] if TRACEMALLOC else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        memory = tracemalloc.get_traced_memory()[0] - self.memory if TRACEMALLOC else None
+        with _lock:
+            stats = _stages.get(self.name)
+            if stats is None:
+                stats = _stages[self.name] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS),
+                                              "memory_delta_max": 0}
+            stats["count"] += 1
+            stats["sum"] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+                    break
+            if memory is not None and memory > stats["memory_delta_max"]:
+                stats["memory_delta_max"] = memory
+        timings = _request.get()
+        if timings is not None:
+            timings._add_stage(self.name, seconds, memory)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str):
+    """Context manager timing one pipeline stage"""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def count(name: str, value: float = 1):
+    """Add value to a process-wide counter (and the current request's)"""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    timings = _request.get()
+    if timings is not None:
+        timings.counters[name] = timings.counters.get(name, 0) + value
+
+
+class collect:
+    """Record a per-request breakdown: `with collect() as timings: ...`"""
+
+    def __enter__(self) -> RequestTimings:
+        self.timings = RequestTimings()
+        self._token = _request.set(self.timings)
+        return self.timings
+
+    def __exit__(self, exc_type, exc, tb):
+        _request.reset(self._token)
+        return False
+
+
+def memory_snapshot(limit: int = 10) -> List[Dict[str, Any]]:
+    """Top allocation sites by size, or [] when tracemalloc is off"""
+    if not tracemalloc.is_tracing():
+        return []
+    top = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+    return [{"location": str(stat.traceback[0]), "size_bytes": stat.size, "blocks": stat.count} for stat in top]
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    """Render stages, counters and any extra gauges in the Prometheus text format"""
+    with _lock:
+        stages = {name: dict(stats, buckets=list(stats["buckets"])) for name, stats in _stages.items()}
+        counters = dict(_counters)
+    worker = f'worker="{os.getpid()}"'
+
+    lines = ['# HELP pipeline_stage_seconds Time spent in each pipeline stage',
+             '# TYPE pipeline_stage_seconds histogram']
+    for name, stats in sorted(stages.items()):
+        label = f'{worker},stage="{_label(name)}"'
+        cumulative = 0
+        for bound, hits in zip(BUCKETS, stats["buckets"]):
+            cumulative += hits
+            lines.append(f'pipeline_stage_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'pipeline_stage_seconds_bucket{{{label},le="+Inf"}} {stats["count"]}')
+        lines.append(f'pipeline_stage_seconds_sum{{{label}}} {stats["sum"]:.6f}')
+        lines.append(f'pipeline_stage_seconds_count{{{label}}} {stats["count"]}')
+
+    lines += ['# HELP pipeline_events_total Items processed by the pipeline',
+              '# TYPE pipeline_events_total counter']
+    for name, value in sorted(counters.items()):
+        lines.append(f'pipeline_events_total{{{worker},event="{_label(name)}"}} {value:g}')
+
+    if TRACEMALLOC:
+        lines += ['# HELP pipeline_stage_memory_delta_bytes Largest net allocation seen in a stage',
+                  '# TYPE pipeline_stage_memory_delta_bytes gauge']
+        for name, stats in sorted(stages.items()):
+            lines.append(f'pipeline_stage_memory_delta_bytes{{{worker},stage="{_label(name)}"}} '
+                         f'{stats["memory_delta_max"]}')
+        current, peak = tracemalloc.get_traced_memory()
+        lines += ['# TYPE pipeline_traced_memory_bytes gauge',
+                  f'pipeline_traced_memory_bytes{{{worker},kind="current"}} {current}',
+                  f'pipeline_traced_memory_bytes{{{worker},kind="peak"}} {peak}']
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{{{worker}}} {value:g}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,100 @@
+import os
+import threading
+from typing import Dict, Any
+from utils.embedding_backends import BACKENDS, backend_id, load_backend
+
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+# sentence-transformer (full precision), quantized (int8) or hashed-tfidf (no model)
+BACKEND = os.environ.get('EMBEDDING_BACKEND', BACKENDS[0])
+
+_models: Dict[str, Any] = {}  # model_id -> EmbeddingBackend, or None if loading failed
+_encoders: Dict[str, Any] = {}
+_lock = threading.Lock()
+_nltk_ready = False
+
+
+def ensure_nltk_data():
+    """Download the NLTK corpora once per process"""
+    global _nltk_ready
+    if _nltk_ready:
+        return
+    with _lock:
+        if _nltk_ready:
+            return
+        try:
+            import nltk
+            nltk.download('punkt', quiet=True)
+            nltk.download('stopwords', quiet=True)
+        except Exception as e:
+            print(f"Warning: NLTK data not available: {e}")
+        _nltk_ready = True
+
+
+def model_id(model_name: str = DEFAULT_MODEL, backend: str = None) -> str:
+    """Name of the vector space produced by a model under a backend"""
+    return backend_id(backend or BACKEND, model_name)
+
+
+def get_model(model_name: str = DEFAULT_MODEL, backend: str = None):
+    """Return the process-wide embedding backend, loading it on first use.
+
+    Returns None if the model cannot be loaded; the failure is remembered so
+    later callers fall back immediately instead of retrying the load.
+    """
+    key = model_id(model_name, backend)
+    if key in _models:
+        return _models[key]
+
+    with _lock:
+        if key not in _models:
+            try:
+                _models[key] = load_backend(backend or BACKEND, model_name)
+            except Exception as e:
+                print(f"Warning: could not load model {key}: {e}")
+                _models[key] = None
+
+    return _models[key]
+
+
+def get_encoder(model_name: str = DEFAULT_MODEL, backend: str = None):
+    """Return the process-wide encoder for the model, or None.
+
+    Model backends sit behind a batching encoder; cheap ones are used directly.
+    """
+    key = model_id(model_name, backend)
+    if key in _encoders:
+        return _encoders[key]
+
+    model = get_model(model_name, backend)
+    with _lock:
+        if key not in _encoders:
+            from utils.batch_encoder import BatchingEncoder
+            if model is None or not model.batched:
+                _encoders[key] = model
+            else:
+                _encoders[key] = BatchingEncoder(
+                    model,
+                    max_batch_size=int(os.environ.get('EMBED_MAX_BATCH', '64')),
+                    max_latency_ms=float(os.environ.get('EMBED_MAX_LATENCY_MS', '5'))
+                )
+
+    return _encoders[key]
+
+
+def encoder_stats() -> Dict[str, Any]:
+    """Throughput and memory of every backend loaded so far, with batching metrics"""
+    stats = {}
+    for key, model in _models.items():
+        if model is None:
+            continue
+        stats[key] = {"backend": model.stats()}
+        encoder = _encoders.get(key)
+        if encoder is not None and encoder is not model:
+            stats[key]["batching"] = encoder.stats()
+    return stats
+
+
+def preload(model_name: str = None):
+    """Load the model and NLTK data eagerly, e.g. at worker boot"""
+    ensure_nltk_data()
+    return get_encoder(model_name or DEFAULT_MODEL)
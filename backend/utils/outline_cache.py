@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hash a file's content in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OutlineCache:
+    """Persistent outline cache keyed by PDF content hash and extractor config.
+
+    Several processes may share cache_dir. Entries written by another process
+    are picked up on lookup, and the in-memory index is rebuilt from disk at
+    most every rescan_seconds on put, so the size limits hold for the whole
+    directory. File mtimes (touched on every hit) give the shared LRU order.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 5000, max_bytes: int = 256 * 1024 * 1024,
+                 rescan_seconds: float = 30):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size on disk, oldest first
+        self._total_bytes = 0
+        self._hash_memo = {}  # (path, mtime_ns, size) -> sha256
+        self._scanned_at = 0.0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files on disk, including other processes' entries"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-5], st.st_size))
+
+        entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        with self._lock:
+            self._entries = entries
+            self._total_bytes = sum(entries.values())
+            self._scanned_at = time.monotonic()
+            self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def content_hash(self, pdf_path: str) -> str:
+        """Return the content hash of a file, memoized on (path, mtime, size)"""
+        st = os.stat(pdf_path)
+        memo_key = (os.path.abspath(pdf_path), st.st_mtime_ns, st.st_size)
+        digest = self._hash_memo.get(memo_key)
+        if digest is None:
+            digest = file_sha256(pdf_path)
+            if len(self._hash_memo) >= 4 * self.max_entries:
+                self._hash_memo.clear()
+            self._hash_memo[memo_key] = digest
+        return digest
+
+    def remember_hash(self, pdf_path: str, digest: str):
+        """Record a hash computed elsewhere (e.g. while streaming an upload)"""
+        st = os.stat(pdf_path)
+        self._hash_memo[(os.path.abspath(pdf_path), st.st_mtime_ns, st.st_size)] = digest
+
+    def make_key(self, content_hash: str, extractor_key: str) -> str:
+        """Combine the content hash with the extractor version/config"""
+        config_hash = hashlib.sha256(extractor_key.encode('utf-8')).hexdigest()[:16]
+        return f"{content_hash}-{config_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached outline, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+        # Not being indexed may only mean another process wrote it, so always try the file
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+                size = f.tell()
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            with self._lock:
+                self._discard(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._total_bytes += size
+            self.hits += 1
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store an outline, evicting the least recently used entries if needed"""
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        tmp_path = self._path(key) + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        if time.monotonic() - self._scanned_at > self.rescan_seconds:
+            self._load_index()
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _discard(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every cached outline"""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes
+            }
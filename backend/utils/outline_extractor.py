@@ -1,33 +1,335 @@
 import pdfplumber
 import json
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
+from pdfminer.pdftypes import PDFObjRef, resolve1
+from pdfminer.psparser import PSLiteral
+from utils.process_pool import run_in_processes, default_workers
+from utils.char_table import CharTable
+from utils.heading_rules import HeadingClassifier, load_rules, rules_fingerprint
+from utils import metrics
 
 class OutlineExtractor:
-    def __init__(self):
+    # Bump whenever extraction output changes so cached outlines are invalidated
+    VERSION = "4"
+    OUTLINE_MODES = ("heuristic", "bookmarks", "hybrid")
+    # Pages scanned to judge whether bookmarks are complete when nothing else needs the page text
+    BOOKMARK_SAMPLE_PAGES = 5
+
+    def __init__(self, cache=None, page_workers: int = None, parallel_page_threshold: int = 200,
+                 pages_per_shard: int = 50, columnar: bool = True, outline_mode: str = "heuristic",
+                 bookmark_agreement: float = 0.6, heading_rules: Dict[str, Any] = None, index_text: bool = True):
+        if outline_mode not in self.OUTLINE_MODES:
+            raise ValueError(f"outline_mode must be one of {self.OUTLINE_MODES}")
         self.font_size_threshold = 2
-        
+        self.cache = cache
+        # "heuristic" always scans chars. "bookmarks" uses the PDF's /Outlines when they
+        # are complete and scans chars otherwise; "hybrid" also merges incomplete
+        # bookmarks into the scanned headings. Bookmarks count as complete when at
+        # least bookmark_agreement of the heading candidates on the checked pages
+        # match a bookmark
+        self.outline_mode = outline_mode
+        self.bookmark_agreement = bookmark_agreement
+        # Per-corpus heading rules; defaults to $HEADING_RULES or the built-in rules
+        self.heading_rules = heading_rules if heading_rules is not None else load_rules()
+        self.classifier = HeadingClassifier(self.heading_rules)
+        # Keep the body text of scanned pages and each heading's span in it ("section_text")
+        self.index_text = index_text
+        # Use the NumPy char-table pipeline instead of per-char dict grouping
+        self.columnar = columnar
+        # Documents with at least parallel_page_threshold pages are scanned in page shards
+        self.page_workers = page_workers if page_workers is not None else default_workers()
+        self.parallel_page_threshold = parallel_page_threshold
+        self.pages_per_shard = pages_per_shard
+
+    def worker_options(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this extractor in a worker process"""
+        # Workers never start pools of their own
+        return {
+            "page_workers": 1,
+            "parallel_page_threshold": self.parallel_page_threshold,
+            "pages_per_shard": self.pages_per_shard,
+            "columnar": self.columnar,
+            "outline_mode": self.outline_mode,
+            "bookmark_agreement": self.bookmark_agreement,
+            "heading_rules": self.heading_rules,
+            "index_text": self.index_text
+        }
+
+    def cache_key(self) -> str:
+        """Version and configuration string that cached outlines depend on"""
+        return json.dumps({
+            "version": self.VERSION,
+            "font_size_threshold": self.font_size_threshold,
+            "outline_mode": self.outline_mode,
+            "bookmark_agreement": self.bookmark_agreement,
+            "heading_rules": rules_fingerprint(self.heading_rules),
+            "index_text": self.index_text
+        }, sort_keys=True)
+
     def extract_outline(self, pdf_path: str) -> Dict[str, Any]:
+        """Extract structured outline from PDF, consulting the cache first"""
+        key, cached = self.lookup_cached(pdf_path)
+        if cached is not None:
+            return cached
+
+        result = self._extract_outline_uncached(pdf_path)
+        self.store_cached(key, result)
+        return result
+
+    def lookup_cached(self, pdf_path: str):
+        """Return (cache key, cached outline or None) without opening the PDF"""
+        if self.cache is None:
+            return None, None
+        try:
+            key = self.cache.make_key(self.cache.content_hash(pdf_path), self.cache_key())
+        except OSError:
+            return None, None
+        cached = self.cache.get(key)
+        metrics.count('outline_cache_hits' if cached is not None else 'outline_cache_misses')
+        return key, cached
+
+    def store_cached(self, key: str, result: Dict[str, Any]):
+        """Cache a successful extraction under a key from lookup_cached"""
+        if self.cache is not None and key is not None and result.get("success"):
+            self.cache.put(key, result)
+
+    def _extract_outline_uncached(self, pdf_path: str) -> Dict[str, Any]:
         """Extract structured outline from PDF using pdfplumber"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                title = self._extract_title(pdf)
-                outline = self._extract_headings(pdf)
-                
+            with metrics.stage('pdf_open'):
+                pdf = pdfplumber.open(pdf_path)
+            with pdf:
+                return self._extract_from_open(pdf, pdf_path)
+        except Exception as e:
+            return self.failed_result(e)
+
+    def _extract_from_open(self, pdf, pdf_path: str) -> Dict[str, Any]:
+        self.classifier.new_document()
+        with metrics.stage('extract_title'):
+            title = self._extract_title(pdf)
+        page_texts = {} if self.index_text else None
+        outline = self._extract_headings(pdf, pdf_path, page_texts)
+        metrics.count('documents')
+        metrics.count('sections', len(outline))
+        
+        result = {
+            "title": title,
+            "outline": outline,
+            "total_pages": len(pdf.pages),
+            "success": True
+        }
+        if page_texts is not None:
+            result["section_text"] = self._section_text(outline, page_texts)
+        return result
+
+    @staticmethod
+    def _section_text(outline: List[Dict[str, Any]], page_texts: Dict[int, str]) -> Dict[str, Any]:
+        """Join the scanned pages' text and locate the body under each heading.
+
+        Returns {"text": str, "spans": [start0, end0, start1, end1, ...]} with
+        one [start, end) pair per outline entry: from the end of the heading
+        line to the start of the next heading. Headings on pages that were
+        not scanned get an empty span. Removes the "offset" each heading
+        found in the page text carries.
+        """
+        page_start = {}
+        position = 0
+        for page in sorted(page_texts):
+            page_start[page] = position
+            position += len(page_texts[page]) + 1
+        text = '\n'.join(page_texts[page] for page in sorted(page_texts))
+
+        # (where the heading line starts, where its body starts)
+        positions = []
+        for heading in outline:
+            offset = heading.pop("offset", None)
+            base = page_start.get(heading["page"])
+            if base is None:
+                positions.append(None)
+            elif offset is None:
+                positions.append((base, base))  # bookmark on a scanned page
+            else:
+                positions.append((base + offset, base + offset + len(heading["text"])))
+
+        spans = [0] * (2 * len(outline))
+        next_heading = len(text)
+        for index in range(len(outline) - 1, -1, -1):
+            if positions[index] is not None:
+                line_start, body_start = positions[index]
+                spans[2 * index] = body_start
+                spans[2 * index + 1] = max(body_start, next_heading)
+                next_heading = min(next_heading, line_start)
+        metrics.count('section_text_chars', len(text))
+        return {"text": text, "spans": spans}
+
+    def extract_preview(self, pdf_path: str, max_pages: int = 3) -> Dict[str, Any]:
+        """Fast title/outline preview that avoids parsing the whole document.
+
+        Returns the full outline when it is cached or the document has at
+        most max_pages pages. Otherwise the embedded bookmarks are used when
+        present (confidence "high"), else headings from the first max_pages
+        pages only (confidence "low"). Previews are marked "preview": True
+        and are never cached.
+        """
+        key, cached = self.lookup_cached(pdf_path)
+        if cached is not None:
+            return dict(cached, preview=False, confidence="high", source="full")
+
+        try:
+            with pdfplumber.open(pdf_path) as pdf, metrics.stage('preview'):
+                page_count = len(pdf.pages)
+                if page_count <= max_pages:
+                    result = self._extract_from_open(pdf, pdf_path)
+                    self.store_cached(key, result)
+                    return dict(result, preview=False, confidence="high", source="full")
+
+                title = self._metadata_title(pdf) or self._extract_title(pdf)
+                outline = self._bookmark_outline(pdf)
+                if outline:
+                    source, confidence, pages_scanned = "bookmarks", "high", 0
+                else:
+                    candidates = list(self._iter_page_candidates(pdf, 0, max_pages))
+                    outline = self._assign_heading_levels(candidates)
+                    source, confidence, pages_scanned = "sampled_pages", "low", max_pages
+
                 return {
                     "title": title,
                     "outline": outline,
-                    "total_pages": len(pdf.pages),
-                    "success": True
+                    "total_pages": page_count,
+                    "success": True,
+                    "preview": True,
+                    "confidence": confidence,
+                    "source": source,
+                    "pages_scanned": pages_scanned
                 }
         except Exception as e:
-            return {
-                "title": "",
-                "outline": [],
-                "total_pages": 0,
-                "success": False,
-                "error": str(e)
-            }
+            return self.failed_result(e)
+
+    def _metadata_title(self, pdf) -> Optional[str]:
+        """Title from the document info dictionary, if it looks meaningful"""
+        title = pdf.metadata.get("Title")
+        if isinstance(title, bytes):
+            title = title.decode('utf-8', errors='ignore')
+        if isinstance(title, str):
+            title = re.sub(r'\s+', ' ', title).strip()
+            if len(title) >= 3 and not title.lower().startswith(('untitled', 'microsoft word')):
+                return title
+        return None
+
+    def _bookmark_outline(self, pdf) -> List[Dict[str, Any]]:
+        """Headings from the PDF's embedded /Outlines (bookmarks), or [] if there are none"""
+        return self._read_bookmarks(pdf)[0]
+
+    def _read_bookmarks(self, pdf):
+        """Return (headings with resolved pages, total number of bookmark entries)"""
+        try:
+            entries = list(pdf.doc.get_outlines())
+        except Exception:
+            return [], 0
+        if not entries:
+            return [], 0
+
+        page_numbers = {page.page_obj.pageid: page.page_number for page in pdf.pages}
+        outline = []
+        for level, title, dest, action, _ in entries:
+            text = re.sub(r'\s+', ' ', title or '').strip()
+            page = self._resolve_bookmark_page(pdf.doc, dest, action, page_numbers)
+            if not text or page is None:
+                continue
+            outline.append({
+                "level": f"H{min(max(level, 1), 3)}",
+                "text": text,
+                "page": page
+            })
+        return outline, len(entries)
+
+    def _usable_bookmarks(self, pdf) -> List[Dict[str, Any]]:
+        """Bookmark headings, or [] when fewer than 90% of the bookmarks resolve to a page"""
+        with metrics.stage('read_bookmarks'):
+            outline, total = self._read_bookmarks(pdf)
+        if not outline or len(outline) < 0.9 * total:
+            return []
+        return outline
+
+    @staticmethod
+    def _heading_key(text: str) -> str:
+        return re.sub(r'[\W_]+', '', text.lower())
+
+    def _bookmarks_agree(self, bookmarks: List[Dict[str, Any]], candidates: List[Dict[str, Any]]) -> bool:
+        """Whether enough heading candidates match a bookmark on the same or a neighbouring page"""
+        if not candidates:
+            return True
+        by_page = {}
+        for heading in bookmarks:
+            by_page.setdefault(heading["page"], []).append(self._heading_key(heading["text"]))
+        matched = 0
+        for candidate in candidates:
+            key = self._heading_key(candidate["text"])
+            nearby = [b for page in (candidate["page"] - 1, candidate["page"], candidate["page"] + 1)
+                      for b in by_page.get(page, ())]
+            if key and any(key in b or b in key for b in nearby if b):
+                matched += 1
+        return matched >= self.bookmark_agreement * len(candidates)
+
+    def _sample_pages(self, page_count: int) -> List[int]:
+        """Evenly spaced 0-based page indices used to check bookmarks without a full scan"""
+        count = min(page_count, self.BOOKMARK_SAMPLE_PAGES)
+        if count <= 1:
+            return list(range(count))
+        return sorted({round(i * (page_count - 1) / (count - 1)) for i in range(count)})
+
+    @staticmethod
+    def _locate_bookmarks(bookmarks: List[Dict[str, Any]], page_texts: Dict[int, str]) -> List[Dict[str, Any]]:
+        """Copies of the bookmarks with the "offset" of their title in the scanned page text, where found"""
+        located = []
+        for heading in bookmarks:
+            heading = dict(heading)
+            page_text = page_texts.get(heading["page"])
+            if page_text is not None:
+                offset = page_text.lower().find(heading["text"].lower())
+                if offset >= 0:
+                    heading["offset"] = offset
+            located.append(heading)
+        return located
+
+    @staticmethod
+    def _resolve_bookmark_page(doc, dest, action, page_numbers: Dict[int, int]) -> Optional[int]:
+        """Map a bookmark's destination (direct, named or GoTo action) to a 1-based page number"""
+        try:
+            if dest is None and action is not None:
+                action = resolve1(action)
+                if not isinstance(action, dict) or getattr(resolve1(action.get("S")), 'name', None) != 'GoTo':
+                    return None
+                dest = action.get("D")
+            dest = resolve1(dest)
+            if isinstance(dest, PSLiteral):
+                dest = dest.name
+            if isinstance(dest, (str, bytes)):
+                dest = resolve1(doc.get_dest(dest))
+            if isinstance(dest, dict):
+                dest = resolve1(dest.get("D"))
+            if not isinstance(dest, list) or not dest:
+                return None
+            target = dest[0]
+            if isinstance(target, PDFObjRef):
+                return page_numbers.get(target.objid)
+            if isinstance(target, int):
+                return target + 1
+        except Exception:
+            return None
+        return None
+
+    @staticmethod
+    def failed_result(error: Exception) -> Dict[str, Any]:
+        """Result returned when a document cannot be processed"""
+        return {
+            "title": "",
+            "outline": [],
+            "total_pages": 0,
+            "success": False,
+            "error": str(error)
+        }
     
     def _extract_title(self, pdf) -> str:
         """Extract document title from first page"""
@@ -50,31 +352,121 @@ class OutlineExtractor:
                 return title_text if title_text else "Untitled Document"
             
             return "Untitled Document"
-        except:
+        except Exception:
             return "Untitled Document"
     
-    def _extract_headings(self, pdf) -> List[Dict[str, Any]]:
-        """Extract hierarchical headings from PDF"""
-        headings = []
+    def _extract_headings(self, pdf, pdf_path: str = None, page_texts: Dict[int, str] = None) -> List[Dict[str, Any]]:
+        """Extract hierarchical headings from PDF, collecting scanned page text into page_texts if given"""
+        page_count = len(pdf.pages)
+        
+        bookmarks = self._usable_bookmarks(pdf) if self.outline_mode != "heuristic" else []
+        if bookmarks and page_texts is None:
+            # Nothing else needs the pages, so a sample decides whether to skip the scan
+            sample = [c for index in self._sample_pages(page_count)
+                      for c in self._iter_page_candidates(pdf, index, index + 1)]
+            if self._bookmarks_agree(bookmarks, sample):
+                metrics.count('bookmark_outlines')
+                return bookmarks
         
-        for page_num, page in enumerate(pdf.pages, 1):
+        # Level assignment needs the whole (compact) candidate stream
+        candidates = self._scan_ranges(pdf, pdf_path, [(0, page_count)], page_texts)
+        if bookmarks and self._bookmarks_agree(bookmarks, candidates):
+            metrics.count('bookmark_outlines')
+            return self._locate_bookmarks(bookmarks, page_texts) if page_texts is not None else bookmarks
+        with metrics.stage('assign_levels'):
+            headings = self._assign_heading_levels(candidates)
+        if not bookmarks or self.outline_mode != "hybrid":
+            return headings
+        
+        # Incomplete bookmarks: keep them and add the scanned headings they miss
+        metrics.count('hybrid_outlines')
+        if page_texts is not None:
+            bookmarks = self._locate_bookmarks(bookmarks, page_texts)
+        known = {(h["page"], self._heading_key(h["text"])) for h in bookmarks}
+        merged = bookmarks + [h for h in headings if (h["page"], self._heading_key(h["text"])) not in known]
+        return sorted(merged, key=lambda h: (h["page"], h.get("offset", 0)))
+    
+    def _scan_ranges(self, pdf, pdf_path: str, ranges: List[tuple],
+                     page_texts: Dict[int, str] = None) -> List[Dict[str, Any]]:
+        """Heading candidates from the given (start, end) page ranges, in page order"""
+        page_total = sum(end - start for start, end in ranges)
+        if pdf_path and self.page_workers > 1 and page_total >= self.parallel_page_threshold:
+            return self._scan_pages_parallel(pdf, pdf_path, ranges, page_texts)
+        return [heading for start, end in ranges
+                for heading in self._iter_page_candidates(pdf, start, end, page_texts)]
+    
+    def _scan_pages(self, pdf, start: int, end: int, page_texts: Dict[int, str] = None) -> List[Dict[str, Any]]:
+        """Collect heading candidates from pages[start:end]"""
+        return list(self._iter_page_candidates(pdf, start, end, page_texts))
+    
+    def _iter_page_candidates(self, pdf, start: int, end: int,
+                              page_texts: Dict[int, str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield heading candidates from pages[start:end], closing each page after use.
+
+        With page_texts, each page's line texts are stored there (joined by
+        newlines) and candidates carry the char "offset" of their line.
+        """
+        for page_num in range(start + 1, end + 1):
+            page = pdf.pages[page_num - 1]
+            page_headings = []
             try:
-                chars = page.chars
-                if not chars:
-                    continue
-                
-                # Group characters by line
-                lines = self._group_chars_by_line(chars)
-                
-                for line in lines:
-                    heading = self._analyze_line_as_heading(line, page_num)
-                    if heading:
-                        headings.append(heading)
+                with metrics.stage('page_parse'):
+                    chars = page.chars
+                metrics.count('pages')
+                metrics.count('chars', len(chars))
+                line_texts = [] if page_texts is not None else None
+                if chars and self.columnar:
+                    page_headings = self._page_candidates_columnar(chars, page_num, line_texts)
+                elif chars:
+                    # Group characters by line
+                    with metrics.stage('group_lines'):
+                        lines = self._group_chars_by_line(chars)
+                    
+                    with metrics.stage('classify_headings'):
+                        offset = 0
+                        for line in lines:
+                            heading = self._analyze_line_as_heading(line, page_num)
+                            if heading:
+                                page_headings.append(heading)
+                            if line_texts is not None:
+                                text = ''.join(char.get('text', '') for char in line).strip()
+                                if heading:
+                                    heading["offset"] = offset
+                                line_texts.append(text)
+                                offset += len(text) + 1
+                if line_texts is not None:
+                    page_texts[page_num] = '\n'.join(line_texts)
             except Exception as e:
                 print(f"Error processing page {page_num}: {e}")
-                continue
+            finally:
+                # Drop pdfplumber's cached layout/objects for this page
+                page.flush_cache()
+            
+            yield from page_headings
+    
+    def _scan_pages_parallel(self, pdf, pdf_path: str, ranges: List[tuple],
+                             page_texts: Dict[int, str] = None) -> List[Dict[str, Any]]:
+        """Scan page shards in worker processes and merge candidates in page order"""
+        shards = [(shard_start, min(shard_start + self.pages_per_shard, end))
+                  for start, end in ranges
+                  for shard_start in range(start, end, self.pages_per_shard)]
+        options = self.worker_options()
+        args_list = [(pdf_path, start, end, options, page_texts is not None) for start, end in shards]
         
-        return self._assign_heading_levels(headings)
+        headings = []
+        for index, shard, error in run_in_processes(scan_pages_in_worker, args_list,
+                                                    workers=self.page_workers, ordered=True):
+            if error is not None:
+                # Rescan a failed shard here so the result matches the sequential path
+                start, end = shards[index]
+                print(f"Page shard {start + 1}-{end} failed in worker ({error}), rescanning")
+                shard = (self._scan_pages(pdf, start, end, page_texts), None)
+            shard_headings, shard_texts = shard
+            headings.extend(shard_headings)
+            if shard_texts is not None and page_texts is not None:
+                page_texts.update(shard_texts)
+        
+        return headings
     
     def _group_chars_by_line(self, chars: List[Dict]) -> List[List[Dict]]:
         """Group characters by line based on y-coordinate"""
@@ -114,7 +506,7 @@ class OutlineExtractor:
         # Extract text and font info
         text = ''.join([char.get('text', '') for char in line_chars]).strip()
         
-        if not text or len(text) < 3:
+        if not text or len(text) < self.classifier.min_length:
             return None
         
         # Get font characteristics
@@ -137,32 +529,40 @@ class OutlineExtractor:
     
     def _is_potential_heading(self, text: str, font_size: float, chars: List[Dict]) -> bool:
         """Determine if text is likely a heading"""
-        # Skip very long text
-        if len(text) > 200:
-            return False
-        
-        # Check for heading patterns
-        heading_patterns = [
-            r'^\d+\.?\s+[A-Z]',  # Numbered headings
-            r'^[A-Z][A-Z\s]{2,}$',  # All caps
-            r'^[A-Z][a-z\s]+:?$',  # Title case
-            r'^\d+\.\d+',  # Subsection numbers
-            r'^(Chapter|Section|Part)\s+\d+',  # Chapter/Section
-        ]
-        
-        for pattern in heading_patterns:
-            if re.match(pattern, text.strip()):
-                return True
-        
-        # Check font size (relative to document)
-        if font_size > 12:
-            return True
-        
         # Check if text is bold or different formatting
-        font_names = [char.get('fontname', '') for char in chars]
-        has_bold = any('bold' in name.lower() for name in font_names)
+        is_bold = self.classifier.is_bold
+        has_bold = any(is_bold(char.get('fontname', '')) for char in chars)
+        
+        # Length, font size, bold and heading patterns (see utils/heading_rules.py)
+        return self.classifier.is_heading(text, font_size, has_bold)
+    
+    def _page_candidates_columnar(self, chars: List[Dict], page_num: int,
+                                  line_texts: List[str] = None) -> List[Dict[str, Any]]:
+        """Columnar equivalent of _group_chars_by_line + _analyze_line_as_heading"""
+        with metrics.stage('group_lines'):
+            table = CharTable(chars)
+            line_bold = table.line_flags(self.classifier.bold_fonts(table.fontnames)).tolist()
+        
+        headings = []
+        is_heading = self.classifier.is_heading
+        offset = 0
+        with metrics.stage('classify_headings'):
+            for index, text, avg_font_size in table.iter_lines():
+                if is_heading(text, avg_font_size, line_bold[index]):
+                    headings.append({
+                        "text": text,
+                        "page": page_num,
+                        "font_size": avg_font_size,
+                        "char_count": len(text),
+                        "level": "H1"  # Will be reassigned later
+                    })
+                    if line_texts is not None:
+                        headings[-1]["offset"] = offset
+                if line_texts is not None:
+                    line_texts.append(text)
+                    offset += len(text) + 1
         
-        return has_bold and len(text) < 100
+        return headings
     
     def _assign_heading_levels(self, headings: List[Dict]) -> List[Dict]:
         """Assign H1, H2, H3 levels based on font size and patterns"""
@@ -192,5 +592,30 @@ class OutlineExtractor:
                 "text": heading['text'],
                 "page": heading['page']
             })
+            if 'offset' in heading:
+                # Consumed by _section_text
+                result[-1]['offset'] = heading['offset']
         
         return result
+
+
+def without_section_text(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The result in the per-PDF JSON format, i.e. without its body text index"""
+    if "section_text" not in result:
+        return result
+    return {k: v for k, v in result.items() if k != "section_text"}
+
+
+def extract_outline_in_worker(pdf_path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Process-pool entry point: extract one PDF with a fresh, uncached extractor"""
+    return OutlineExtractor(**options)._extract_outline_uncached(pdf_path)
+
+
+def scan_pages_in_worker(pdf_path: str, start: int, end: int, options: Dict[str, Any], with_text: bool = False):
+    """Process-pool entry point: open the PDF independently and scan one page range.
+
+    Returns (heading candidates, page texts or None).
+    """
+    page_texts = {} if with_text else None
+    with pdfplumber.open(pdf_path) as pdf:
+        return OutlineExtractor(**options)._scan_pages(pdf, start, end, page_texts), page_texts
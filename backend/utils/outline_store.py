@@ -0,0 +1,237 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from array import array
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Keys stored in their own columns; anything else in a result goes to `extra`,
+# except the extractor's "section_text", which the outline cache keeps instead
+_COLUMN_KEYS = ("title", "outline", "total_pages", "success", "error")
+_UNSTORED_KEYS = ("section_text",)
+_TEXT_SEPARATOR = '\x1f'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outlines (
+    filename TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    title TEXT,
+    total_pages INTEGER,
+    success INTEGER,
+    error TEXT,
+    heading_count INTEGER,
+    levels BLOB,
+    pages BLOB,
+    texts TEXT,
+    extra TEXT,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS outlines_seq ON outlines(seq);
+"""
+
+
+def _encode_outline(outline: List[Dict[str, Any]]) -> Optional[Tuple[bytes, bytes, str]]:
+    """Pack headings into (levels uint8, pages int32, joined texts), or None if they do not fit"""
+    levels = array('B')
+    pages = array('i')
+    texts = []
+    for heading in outline:
+        level, text, page = heading.get("level"), heading.get("text"), heading.get("page")
+        if (len(heading) != 3 or not isinstance(level, str) or not level[1:].isdigit() or not level.startswith('H')
+                or int(level[1:]) > 255
+                or not isinstance(text, str) or _TEXT_SEPARATOR in text or not isinstance(page, int)):
+            return None
+        levels.append(int(level[1:]))
+        pages.append(page)
+        texts.append(text)
+    return levels.tobytes(), pages.tobytes(), _TEXT_SEPARATOR.join(texts)
+
+
+def _decode_outline(count: int, levels: bytes, pages: bytes, texts: str) -> List[Dict[str, Any]]:
+    if not count:
+        return []
+    level_values = array('B', levels)
+    page_values = array('i', pages)
+    return [{"level": f"H{level}", "text": text, "page": page}
+            for level, text, page in zip(level_values, texts.split(_TEXT_SEPARATOR), page_values)]
+
+
+class OutlineStore:
+    """Single-file SQLite store of extracted outlines, one row per document.
+
+    Headings are packed column-wise (levels, pages and texts per document),
+    so a document is read with one row lookup and a library-wide scan does
+    not parse any JSON. Results round-trip exactly: keys without a column
+    and outlines that do not fit the packed layout are kept as JSON.
+
+    A result's "section_text" body index is not stored; the outline cache
+    keeps it. Putting a result identical to the stored one (by content
+    hash) is a no-op.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def put(self, filename: str, result: Dict[str, Any]) -> bool:
+        """Insert or replace the outline of one document; returns False if the stored one is identical"""
+        result = {k: v for k, v in result.items() if k not in _UNSTORED_KEYS}
+        canonical = json.dumps(result, sort_keys=True, ensure_ascii=False)
+        content_hash = hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+        conn = self._conn()
+        row = conn.execute('SELECT content_hash FROM outlines WHERE filename = ?', (filename,)).fetchone()
+        if row is not None and row[0] == content_hash:
+            # Unchanged: skip the write and keep seq, so nothing is re-indexed
+            return False
+
+        outline = result.get("outline", [])
+        extra = {k: v for k, v in result.items() if k not in _COLUMN_KEYS}
+        packed = _encode_outline(outline)
+        if packed is None:
+            extra["outline"] = outline
+            packed = (b'', b'', '')
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            seq = conn.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM outlines').fetchone()[0]
+            conn.execute(
+                'INSERT OR REPLACE INTO outlines (filename, seq, title, total_pages, success, error, heading_count, '
+                'levels, pages, texts, extra, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (filename, seq, result.get("title"), result.get("total_pages"), int(bool(result.get("success"))),
+                 result.get("error"), len(outline), packed[0], packed[1], packed[2],
+                 json.dumps(extra, ensure_ascii=False) if extra else None, content_hash))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def _row_to_result(self, row) -> Dict[str, Any]:
+        title, total_pages, success, error, count, levels, pages, texts, extra = row
+        result = {
+            "title": title,
+            "outline": _decode_outline(count, levels, pages, texts),
+            "total_pages": total_pages,
+            "success": bool(success)
+        }
+        if error is not None:
+            result["error"] = error
+        if extra:
+            result.update(json.loads(extra))
+        return result
+
+    _RESULT_COLUMNS = 'title, total_pages, success, error, heading_count, levels, pages, texts, extra'
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Load one document's outline, or None if it is not stored"""
+        row = self._conn().execute(f'SELECT {self._RESULT_COLUMNS} FROM outlines WHERE filename = ?',
+                                   (filename,)).fetchone()
+        return self._row_to_result(row) if row is not None else None
+
+    def __contains__(self, filename: str) -> bool:
+        return self._conn().execute('SELECT 1 FROM outlines WHERE filename = ?', (filename,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM outlines').fetchone()[0]
+
+    def remove(self, filename: str) -> bool:
+        return self._conn().execute('DELETE FROM outlines WHERE filename = ?', (filename,)).rowcount > 0
+
+    def documents(self, filenames: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Per-document metadata without reading any headings, optionally only for the given filenames"""
+        query = 'SELECT filename, title, total_pages, success, heading_count FROM outlines'
+        if filenames is None:
+            rows = self._conn().execute(query + ' ORDER BY filename').fetchall()
+        else:
+            names = sorted(set(filenames))
+            rows = []
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                rows += self._conn().execute(
+                    f'{query} WHERE filename IN ({",".join("?" * len(chunk))}) ORDER BY filename', chunk).fetchall()
+        return [{"filename": filename, "title": title, "total_pages": total_pages, "success": bool(success),
+                 "sections": count} for filename, title, total_pages, success, count in rows]
+
+    def iter_outlines(self, since_seq: int = 0, batch_size: int = 500) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """Yield (seq, filename, result) for documents written after since_seq, oldest first"""
+        cursor = self._conn().execute(
+            f'SELECT seq, filename, {self._RESULT_COLUMNS} FROM outlines WHERE seq > ? ORDER BY seq', (since_seq,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], row[1], self._row_to_result(row[2:])
+
+    def iter_headings(self) -> Iterator[Tuple[str, str, str, int]]:
+        """Yield (filename, level, text, page) for every stored heading"""
+        for _, filename, result in self.iter_outlines():
+            for heading in result["outline"]:
+                yield filename, heading.get("level"), heading.get("text"), heading.get("page")
+
+    def export_json(self, filename: str, path: str) -> bool:
+        """Write one document in the legacy per-PDF JSON format"""
+        result = self.get(filename)
+        if result is None:
+            return False
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        return True
+
+    def export_dir(self, output_dir: str) -> int:
+        """Write every stored document as <name>.json into output_dir"""
+        os.makedirs(output_dir, exist_ok=True)
+        count = 0
+        for _, filename, result in self.iter_outlines():
+            with open(os.path.join(output_dir, os.path.splitext(filename)[0] + '.json'), 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            count += 1
+        return count
+
+    def import_json_dir(self, output_dir: str) -> int:
+        """Load legacy <name>.json outlines that are not stored yet"""
+        if not os.path.isdir(output_dir):
+            return 0
+        known = {row[0] for row in self._conn().execute('SELECT filename FROM outlines')}
+        count = 0
+        for entry in os.scandir(output_dir):
+            if not entry.name.endswith('.json') or entry.name.startswith('.'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(result, dict) or "outline" not in result:
+                continue
+            filename = result.get("filename") or entry.name[:-5] + '.pdf'
+            if filename not in known:
+                self.put(filename, result)
+                known.add(filename)
+                count += 1
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        documents, headings, max_seq = self._conn().execute(
+            'SELECT COUNT(*), COALESCE(SUM(heading_count), 0), COALESCE(MAX(seq), 0) FROM outlines').fetchone()
+        return {
+            "documents": documents,
+            "headings": headings,
+            "seq": max_seq,
+            "bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        }
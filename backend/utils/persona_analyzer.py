@@ -1,49 +1,129 @@
-import json
+import os
 import re
+import copy
+import hashlib
+import threading
 from typing import List, Dict, Any, Tuple
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-import nltk
-from collections import defaultdict
+from utils import model_registry
+from utils.embedding_store import l2_normalize
+from utils.result_cache import LRUCache
+from utils.section_ranking import Vocabulary, TokenMatrix, overlap_scores, bm25_scores, top_k_indices, tokenize
+from utils.vector_index import document_key
+from utils import metrics
+
+# Shared by every analyzer in the process; see analyze_documents_for_persona
+_result_cache = LRUCache(int(os.environ.get('PERSONA_RESULT_CACHE', '256')))
+_document_scores = LRUCache(int(os.environ.get('PERSONA_SCORE_CACHE', '20000')))
+_document_tokens = LRUCache(int(os.environ.get('PERSONA_TOKEN_CACHE', '20000')))
+# Token ids only mean something within the vocabulary that assigned them, so
+# the vocabulary is replaced together with the token matrices once it is this big
+PERSONA_VOCABULARY_LIMIT = int(os.environ.get('PERSONA_VOCABULARY_LIMIT', '500000'))
+_vocabulary = Vocabulary()
+_vocabulary_lock = threading.Lock()
+TOP_SECTIONS = 15
+# Body text under a heading (the extractor's "section_text") considered for refined text
+MAX_SECTION_CHARS = 20000
+PASSAGE_CHARS = 500
+# overlap reproduces the original keyword fallback; bm25 weights rare terms higher
+KEYWORD_SCORING = ('overlap', 'bm25')
+
+def _body_hash(doc: Dict) -> str:
+    """Digest of a document's section_text body, part of the result cache key"""
+    return hashlib.sha1((doc.get("section_text") or {}).get("text", "").encode('utf-8')).hexdigest()
+
+def cache_stats() -> Dict[str, Any]:
+    return {"results": _result_cache.stats(), "document_scores": _document_scores.stats(),
+            "document_tokens": _document_tokens.stats(), "vocabulary": len(_vocabulary)}
+
+def _reset_vocabulary(limit: int = -1):
+    """Start a new vocabulary (dropping the token matrices) if the current one has more than limit tokens"""
+    global _vocabulary
+    with _vocabulary_lock:
+        if len(_vocabulary) > limit:
+            _vocabulary = Vocabulary()
+            _document_tokens.clear()
+
+def _current_vocabulary() -> Vocabulary:
+    """The shared vocabulary, started afresh once it outgrows PERSONA_VOCABULARY_LIMIT"""
+    if len(_vocabulary) > PERSONA_VOCABULARY_LIMIT:
+        _reset_vocabulary(PERSONA_VOCABULARY_LIMIT)
+    return _vocabulary
+
+def clear_caches():
+    """Drop cached results, scores, token matrices and the vocabulary (e.g. to measure a cold request)"""
+    _result_cache.clear()
+    _document_scores.clear()
+    _reset_vocabulary()
 
 class PersonaAnalyzer:
-    def __init__(self):
-        try:
-            # Use a lightweight sentence transformer model
-            self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
-            nltk.download('punkt', quiet=True)
-            nltk.download('stopwords', quiet=True)
-        except:
-            self.embedder = None
+    def __init__(self, model_name: str = model_registry.DEFAULT_MODEL, embedding_store=None,
+                 keyword_scoring: str = 'overlap', backend: str = None):
+        if keyword_scoring not in KEYWORD_SCORING:
+            raise ValueError(f"keyword_scoring must be one of {KEYWORD_SCORING}, got {keyword_scoring!r}")
+        # Borrow the process-wide model; loading happens once per worker and
+        # concurrent analyzers share batched forward passes
+        self.model_name = model_name
+        self.model_id = model_registry.model_id(model_name, backend)
+        self.keyword_scoring = keyword_scoring
+        self.embedder = model_registry.get_encoder(model_name, backend)
+        self.embedding_store = embedding_store
+        model_registry.ensure_nltk_data()
+        if self.embedder is None:
             print("Warning: Sentence transformer not available, using fallback methods")
     
     def analyze_documents_for_persona(self, documents_data: List[Dict], persona: str, job_to_be_done: str) -> Dict[str, Any]:
         """
         Analyze documents based on persona and job requirements
+
+        Identical requests (same persona, job, model and document contents)
+        are answered from an LRU cache. Otherwise section scores are kept per
+        document, so only documents that are new or changed get scored, and
+        the top sections are picked with argpartition. Refined text is the
+        best-matching passage of a section's body when the document carries
+        the extractor's section_text index.
         """
         try:
-            # Extract all sections from documents
-            all_sections = self._extract_all_sections(documents_data)
+            doc_keys = [document_key(doc.get("filename", "unknown.pdf"), doc.get("outline", []))
+                        for doc in documents_data]
+            body_hashes = tuple(_body_hash(doc) for doc in documents_data)
+            result_key = (persona, job_to_be_done, self._ranking_mode(), tuple(doc_keys), body_hashes)
+            cached = _result_cache.get(result_key)
+            if cached is not None:
+                metrics.count('persona_result_cache_hits')
+                return copy.deepcopy(cached)
+            
+            total_sections = sum(len(doc.get("outline", [])) for doc in documents_data)
+            metrics.count('sections_ranked', total_sections)
             
             # Rank sections based on persona and job
-            ranked_sections = self._rank_sections_for_persona(all_sections, persona, job_to_be_done)
+            with metrics.stage('rank_sections'):
+                ranked_sections, positions, mode = self._rank_documents_for_persona(
+                    documents_data, doc_keys, persona, job_to_be_done, TOP_SECTIONS)
             
             # Extract sub-sections
-            sub_sections = self._extract_subsections(ranked_sections[:10], persona, job_to_be_done)
+            with metrics.stage('subsections'):
+                bodies = [self._section_body(documents_data[doc_index], section_index)
+                          for doc_index, section_index in positions[:10]]
+                sub_sections = self._extract_subsections(ranked_sections[:10], persona, job_to_be_done,
+                                                         bodies, mode)
             
-            return {
+            result = {
                 "metadata": {
                     "documents": [doc.get("filename", "unknown.pdf") for doc in documents_data],
                     "persona": persona,
                     "job_to_be_done": job_to_be_done,
                     "processing_timestamp": "2025-07-22T12:36:00Z",
-                    "total_sections_analyzed": len(all_sections)
+                    "total_sections_analyzed": total_sections
                 },
-                "extracted_sections": ranked_sections[:15],  # Top 15 sections
+                "extracted_sections": ranked_sections,  # Top 15 sections
                 "sub_section_analysis": sub_sections,
                 "success": True
             }
+            if mode == self._ranking_mode():
+                # Results of a fallback after a model failure are not cached
+                _result_cache.put(result_key, copy.deepcopy(result))
+            return result
         except Exception as e:
             return {
                 "metadata": {
@@ -58,85 +138,133 @@ class PersonaAnalyzer:
                 "error": str(e)
             }
     
-    def _extract_all_sections(self, documents_data: List[Dict]) -> List[Dict]:
-        """Extract all sections from all documents"""
-        all_sections = []
-        
-        for doc_data in documents_data:
-            filename = doc_data.get("filename", "unknown.pdf")
-            outline = doc_data.get("outline", [])
-            
-            for i, heading in enumerate(outline):
-                section = {
-                    "document": filename,
-                    "page": heading.get("page", 1),
-                    "section_title": heading.get("text", ""),
-                    "level": heading.get("level", "H1"),
-                    "importance_rank": 0,  # Will be calculated
-                    "section_id": f"{filename}_{i}"
-                }
-                all_sections.append(section)
-        
-        return all_sections
+    def _ranking_mode(self) -> str:
+        return f"semantic:{self.model_id}" if self.embedder else self._keyword_mode()
     
-    def _rank_sections_for_persona(self, sections: List[Dict], persona: str, job_to_be_done: str) -> List[Dict]:
-        """Rank sections based on persona and job relevance"""
-        if not sections:
-            return []
-        
+    def _keyword_mode(self) -> str:
+        return f"keyword:{self.keyword_scoring}"
+    
+    def _make_section(self, filename: str, index: int, heading: Dict, score: float = 0) -> Dict:
+        return {
+            "document": filename,
+            "page": heading.get("page", 1),
+            "section_title": heading.get("text", ""),
+            "level": heading.get("level", "H1"),
+            "importance_rank": score,
+            "section_id": f"{filename}_{index}"
+        }
+    
+    def _rank_documents_for_persona(self, documents_data: List[Dict], doc_keys: List[str], persona: str,
+                                    job_to_be_done: str, top_k: int) -> Tuple[List[Dict], List[Tuple[int, int]], str]:
+        """Top sections, their (document index, section index) and the ranking mode that produced them"""
         # Create persona + job context
         context = f"{persona} needs to {job_to_be_done}"
         
-        if self.embedder:
-            return self._semantic_ranking(sections, context)
-        else:
-            return self._keyword_ranking(sections, context)
-    
-    def _semantic_ranking(self, sections: List[Dict], context: str) -> List[Dict]:
-        """Use semantic similarity for ranking"""
+        mode = self._ranking_mode()
         try:
-            # Get section texts
-            section_texts = [section["section_title"] for section in sections]
-            
-            # Encode context and sections
-            context_embedding = self.embedder.encode([context])
-            section_embeddings = self.embedder.encode(section_texts)
-            
-            # Calculate similarities
-            similarities = cosine_similarity(context_embedding, section_embeddings)[0]
-            
-            # Add importance ranks
-            for i, section in enumerate(sections):
-                section["importance_rank"] = float(similarities[i])
-            
-            # Sort by importance
-            return sorted(sections, key=lambda x: x["importance_rank"], reverse=True)
-        
+            scores = self._section_scores(documents_data, doc_keys, context, mode)
         except Exception as e:
             print(f"Semantic ranking failed: {e}, falling back to keyword ranking")
-            return self._keyword_ranking(sections, context)
+            mode = self._keyword_mode()
+            scores = self._section_scores(documents_data, doc_keys, context, mode)
+        
+        # Section dicts are only built for the winners; ties keep document order
+        offsets = np.cumsum([0] + [len(doc.get("outline", [])) for doc in documents_data])
+        ranked = []
+        positions = []
+        for index in top_k_indices(scores, top_k):
+            doc_index = int(np.searchsorted(offsets, index, side='right')) - 1
+            section_index = int(index - offsets[doc_index])
+            doc_data = documents_data[doc_index]
+            ranked.append(self._make_section(doc_data.get("filename", "unknown.pdf"), section_index,
+                                             doc_data.get("outline", [])[section_index], float(scores[index])))
+            positions.append((doc_index, section_index))
+        return ranked, positions, mode
+    
+    def _section_scores(self, documents_data: List[Dict], doc_keys: List[str], context: str,
+                        mode: str) -> np.ndarray:
+        """Scores of every section of every document, in document order"""
+        if mode == "keyword:bm25":
+            # BM25 statistics span the whole request, so only the token matrices are cached
+            vocab = _current_vocabulary()
+            matrix = TokenMatrix.concat(self._token_matrices(documents_data, doc_keys, vocab))
+            return bm25_scores(matrix, vocab.ids(tokenize(context)))
+        return np.concatenate([np.zeros(0)] + self._document_scores(documents_data, doc_keys, context, mode))
     
-    def _keyword_ranking(self, sections: List[Dict], context: str) -> List[Dict]:
-        """Fallback keyword-based ranking"""
-        context_keywords = set(re.findall(r'\b\w+\b', context.lower()))
+    def _token_matrices(self, documents_data: List[Dict], doc_keys: List[str],
+                        vocab: Vocabulary) -> List[TokenMatrix]:
+        """Tokenized titles per document, built once per document content and vocabulary"""
+        matrices = []
+        for doc_data, key in zip(documents_data, doc_keys):
+            cached = _document_tokens.get(key)
+            # Entries remember their vocabulary; one built on a replaced vocabulary is rebuilt
+            if cached is not None and cached[0] is vocab:
+                matrix = cached[1]
+            else:
+                titles = [heading.get("text", "") for heading in doc_data.get("outline", [])]
+                matrix = TokenMatrix.from_titles(titles, vocab)
+                _document_tokens.put(key, (vocab, matrix))
+            matrices.append(matrix)
+        return matrices
+    
+    def _document_scores(self, documents_data: List[Dict], doc_keys: List[str], context: str,
+                         mode: str) -> List[np.ndarray]:
+        """Per-document section scores, computing only documents not scored for this context before"""
+        scores = [_document_scores.get((mode, context, key)) for key in doc_keys]
+        missing = [i for i, doc_scores in enumerate(scores) if doc_scores is None]
+        if not missing:
+            return scores
+        metrics.count('persona_documents_scored', len(missing))
         
-        for section in sections:
-            title = section["section_title"].lower()
-            title_words = set(re.findall(r'\b\w+\b', title))
-            
-            # Calculate overlap score
-            overlap = len(context_keywords.intersection(title_words))
-            section["importance_rank"] = overlap / max(len(context_keywords), 1)
+        missing_docs = [documents_data[i] for i in missing]
+        if mode.startswith("keyword"):
+            vocab = _current_vocabulary()
+            matrix = TokenMatrix.concat(self._token_matrices(missing_docs, [doc_keys[i] for i in missing], vocab))
+            flat_scores = overlap_scores(matrix, vocab.ids(tokenize(context)))
+        else:
+            titles = [heading.get("text", "") for doc in missing_docs for heading in doc.get("outline", [])]
+            flat_scores = self._semantic_scores(titles, context)
         
-        return sorted(sections, key=lambda x: x["importance_rank"], reverse=True)
+        offset = 0
+        for i, doc_data in zip(missing, missing_docs):
+            count = len(doc_data.get("outline", []))
+            scores[i] = flat_scores[offset:offset + count]
+            offset += count
+            _document_scores.put((mode, context, doc_keys[i]), scores[i])
+        return scores
     
-    def _extract_subsections(self, top_sections: List[Dict], persona: str, job_to_be_done: str) -> List[Dict]:
-        """Extract and analyze sub-sections from top sections"""
-        sub_sections = []
+    def _semantic_scores(self, section_texts: List[str], context: str) -> np.ndarray:
+        """Use semantic similarity for ranking"""
+        if not section_texts:
+            return np.zeros(0)
+        
+        # Encode the context; section embeddings come from the store when cached
+        with metrics.stage('embed_sections'):
+            context_embedding = l2_normalize(self.embedder.encode([context]))[0]
+            if self.embedding_store is not None:
+                section_embeddings = self.embedding_store.get_embeddings(section_texts, self.embedder.encode)
+            else:
+                section_embeddings = l2_normalize(self.embedder.encode(section_texts))
+        
+        # Cosine similarity of unit vectors is a single matrix-vector product
+        return (section_embeddings @ context_embedding).astype(np.float64)
+    
+    def _extract_subsections(self, top_sections: List[Dict], persona: str, job_to_be_done: str,
+                             bodies: List[str] = None, mode: str = None) -> List[Dict]:
+        """Extract and analyze sub-sections from top sections.
+
+        bodies[i] is the body text of top_sections[i] ("" if unknown); its
+        passage closest to the persona and job becomes the refined text.
+        Sections without body text get a templated summary.
+        """
+        top_sections = top_sections[:5]  # Top 5 sections only
+        bodies = (bodies or [])[:len(top_sections)]
+        passages = self._best_passages(bodies, f"{persona} needs to {job_to_be_done}", mode or self._ranking_mode())
         
-        for section in top_sections[:5]:  # Top 5 sections only
-            # Simulate sub-section extraction
-            refined_text = self._generate_refined_text(section, persona, job_to_be_done)
+        sub_sections = []
+        for i, section in enumerate(top_sections):
+            refined_text = passages[i] if i < len(passages) and passages[i] else \
+                self._generate_refined_text(section, persona, job_to_be_done)
             
             sub_section = {
                 "document": section["document"],
@@ -150,6 +278,78 @@ class PersonaAnalyzer:
         
         return sub_sections
     
+    def _section_body(self, doc_data: Dict, section_index: int) -> str:
+        """Body text under one heading from the document's section_text index"""
+        section_text = doc_data.get("section_text")
+        if not section_text:
+            return ""
+        spans = section_text.get("spans", [])
+        if 2 * section_index + 1 >= len(spans):
+            return ""
+        start, end = spans[2 * section_index], spans[2 * section_index + 1]
+        return section_text.get("text", "")[start:min(end, start + MAX_SECTION_CHARS)]
+    
+    def _split_passages(self, body: str) -> List[str]:
+        """Sentences packed into passages of at most about PASSAGE_CHARS characters.
+
+        Sentences longer than that (or text without punctuation) are cut at word boundaries.
+        """
+        pieces = []
+        for sentence in re.split(r'(?<=[.!?])\s+', re.sub(r'\s+', ' ', body).strip()):
+            while len(sentence) > PASSAGE_CHARS:
+                cut = sentence.rfind(' ', 0, PASSAGE_CHARS)
+                cut = cut if cut > 0 else PASSAGE_CHARS
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            pieces.append(sentence)
+        
+        passages = []
+        current = ""
+        for sentence in pieces:
+            if not sentence:
+                continue
+            if current and len(current) + len(sentence) + 1 > PASSAGE_CHARS:
+                passages.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            passages.append(current)
+        return passages
+    
+    def _best_passages(self, bodies: List[str], context: str, mode: str) -> List[str]:
+        """Most relevant passage of each body ("" for empty bodies), scored in one batch"""
+        split = [self._split_passages(body) for body in bodies]
+        flat = [passage for passages in split for passage in passages]
+        if not flat:
+            return ["" for _ in bodies]
+        
+        scores = None
+        if mode.startswith("semantic") and self.embedder is not None:
+            try:
+                with metrics.stage('embed_passages'):
+                    vectors = l2_normalize(self.embedder.encode([context] + flat))
+                scores = vectors[1:] @ vectors[0]
+            except Exception as e:
+                print(f"Passage embedding failed: {e}, falling back to keyword scoring")
+        if scores is None:
+            # A throwaway vocabulary, so body text does not grow the shared one
+            vocabulary = Vocabulary()
+            matrix = TokenMatrix.from_titles(flat, vocabulary)
+            query_ids = vocabulary.ids(tokenize(context))
+            scores = bm25_scores(matrix, query_ids) if self.keyword_scoring == "bm25" else overlap_scores(matrix, query_ids)
+        metrics.count('passages_ranked', len(flat))
+        
+        best = []
+        offset = 0
+        for passages in split:
+            if passages:
+                best.append(passages[int(np.argmax(scores[offset:offset + len(passages)]))])
+            else:
+                best.append("")
+            offset += len(passages)
+        return best
+    
     def _generate_refined_text(self, section: Dict, persona: str, job_to_be_done: str) -> str:
         """Generate refined text for a section based on persona and job"""
         title = section["section_title"]
@@ -0,0 +1,169 @@
+import os
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Any
+
+
+class TaskTimeout(BaseException):
+    """Raised inside a worker when a task exceeds its time budget.
+
+    A BaseException, so the `except Exception` handlers that keep extraction
+    going past a bad page cannot swallow it.
+    """
+
+# How often the alarm fires again once the budget is spent, in case code
+# under fn() still catches the first TaskTimeout
+_TIMEOUT_REPEAT = 0.5
+_alarm = {"armed": False, "fired": False}
+
+# Long-lived pools by worker count, so spawned interpreters (and the modules
+# they import) are reused across calls; owned by the process that built them
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_pid = os.getpid()
+_pools_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def _raise_timeout(signum, frame):
+    _alarm["fired"] = True
+    if _alarm["armed"]:
+        raise TaskTimeout()
+
+
+def _run_with_timeout(fn: Callable, args: tuple, timeout: Optional[float]):
+    """Run fn(*args) in the worker, interrupting it after timeout seconds.
+
+    A task whose budget ran out always fails, even if it swallowed the
+    interruption and returned, so partial results are never reported.
+    """
+    if not timeout:
+        return fn(*args)
+
+    _alarm.update(armed=True, fired=False)
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout, _TIMEOUT_REPEAT)
+    result = None
+    try:
+        try:
+            result = fn(*args)
+        finally:
+            # From here on a late alarm is only recorded, never raised
+            _alarm["armed"] = False
+    except TaskTimeout:
+        pass
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    if _alarm["fired"]:
+        raise TaskTimeout(f"timed out after {timeout}s")
+    return result
+
+
+def _shared_pool(workers: int) -> ProcessPoolExecutor:
+    """This process's pool with the given number of workers, created on first use"""
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Forked (e.g. a preloaded gunicorn worker): the parent's pools are not ours
+            _pools.clear()
+            _pools_pid = os.getpid()
+        executor = _pools.get(workers)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pools[workers] = executor
+        return executor
+
+
+def _discard_pool(workers: int, executor: ProcessPoolExecutor):
+    """Drop a broken pool so the next round builds a fresh one"""
+    with _pools_lock:
+        if _pools.get(workers) is executor:
+            del _pools[workers]
+    executor.shutdown(wait=False)
+
+
+def _run_round(fn, tasks: List[Tuple[int, tuple]], workers: int, timeout: Optional[float], shared: bool = True):
+    """Run one pool round; yield (index, result, error) and collect crashed tasks.
+
+    Shared rounds run on the long-lived pool for `workers`; others get a
+    pool of their own that is shut down afterwards.
+    """
+    if shared:
+        executor = _shared_pool(workers)
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                       mp_context=multiprocessing.get_context('spawn'))
+    crashed = []
+    futures = {}
+    try:
+        for index, args in tasks:
+            try:
+                futures[executor.submit(_run_with_timeout, fn, args, timeout)] = (index, args)
+            except BrokenProcessPool:
+                crashed.append((index, args))
+        for future in as_completed(futures):
+            index, args = futures[future]
+            try:
+                yield index, future.result(), None
+            except BrokenProcessPool:
+                crashed.append((index, args))
+            except (Exception, TaskTimeout) as e:
+                yield index, None, e
+    finally:
+        # Tasks not started yet when the caller stops iterating must not hold the pool
+        for future in futures:
+            future.cancel()
+        if not shared:
+            executor.shutdown(wait=True)
+        elif crashed:
+            _discard_pool(workers, executor)
+    return crashed
+
+
+def run_in_processes(fn: Callable, args_list: Sequence[tuple], workers: int = None,
+                     timeout: Optional[float] = None, ordered: bool = True) -> Iterator[Tuple[int, Any, Optional[Exception]]]:
+    """Run fn over args_list in worker processes.
+
+    Yields (index, result, error) tuples, either in input order or as tasks
+    complete. Work runs on a pool that is kept for the life of the process.
+    A task that kills its worker process breaks the pool, so the pool is
+    rebuilt, the unfinished tasks are retried on it and, if it breaks again,
+    each is run in a throwaway pool of its own so that only the offending
+    task is reported as failed.
+    """
+    workers = workers or default_workers()
+    tasks = list(enumerate(args_list))
+    if not tasks:
+        return
+
+    results = _retrying_rounds(fn, tasks, workers, timeout)
+    yield from (in_index_order(results) if ordered else results)
+
+
+def in_index_order(items: Iterator[tuple]) -> Iterator[tuple]:
+    """Re-order a stream of (index, ...) tuples covering 0..n-1 by index"""
+    buffered = {}
+    next_index = 0
+    for item in items:
+        buffered[item[0]] = item
+        while next_index in buffered:
+            yield buffered.pop(next_index)
+            next_index += 1
+
+
+def _retrying_rounds(fn, tasks, workers, timeout):
+    crashed = yield from _run_round(fn, tasks, workers, timeout)
+    if crashed:
+        crashed = yield from _run_round(fn, crashed, workers, timeout)
+
+    # Isolate each remaining task so a crash only affects itself
+    for task in crashed:
+        still_crashed = yield from _run_round(fn, [task], 1, timeout, shared=False)
+        for index, _ in still_crashed:
+            yield index, None, BrokenProcessPool("worker process died while processing this task")
@@ -0,0 +1,121 @@
+import re
+import threading
+from typing import Dict, List
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\b\w+\b')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class Vocabulary:
+    """Process-wide token -> integer id map"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def ids(self, tokens: List[str]) -> List[int]:
+        """Ids of tokens, assigning new ids to unseen tokens"""
+        ids = self._ids
+        missing = [t for t in tokens if t not in ids]
+        if missing:
+            with self._lock:
+                for token in missing:
+                    ids.setdefault(token, len(ids))
+        return [ids[t] for t in tokens]
+
+
+class TokenMatrix:
+    """Token ids of many titles in CSR form: row i is ids[indptr[i]:indptr[i + 1]]"""
+
+    __slots__ = ('indptr', 'ids')
+
+    def __init__(self, indptr: np.ndarray, ids: np.ndarray):
+        self.indptr = indptr
+        self.ids = ids
+
+    @classmethod
+    def from_titles(cls, titles: List[str], vocab: Vocabulary) -> 'TokenMatrix':
+        rows = [vocab.ids(tokenize(title)) for title in titles]
+        indptr = np.concatenate([[0], np.cumsum([len(row) for row in rows], dtype=np.int64)])
+        ids = np.fromiter((i for row in rows for i in row), dtype=np.int64, count=int(indptr[-1]))
+        return cls(indptr, ids)
+
+    @classmethod
+    def concat(cls, matrices: List['TokenMatrix']) -> 'TokenMatrix':
+        if not matrices:
+            return cls(np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        offsets = np.cumsum([0] + [int(m.indptr[-1]) for m in matrices[:-1]])
+        indptr = np.concatenate([np.zeros(1, dtype=np.int64)] +
+                                [m.indptr[1:] + offset for m, offset in zip(matrices, offsets)])
+        return cls(indptr, np.concatenate([m.ids for m in matrices]))
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def row_index(self) -> np.ndarray:
+        """Row number of every entry in ids"""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+
+    def query_pairs(self, query: np.ndarray):
+        """(rows, token ids, term counts) of the distinct query tokens present in each row"""
+        hit = np.isin(self.ids, query)
+        if not hit.any():
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        ids = self.ids[hit]
+        width = int(ids.max()) + 1
+        # One int64 key per (row, token) pair is much cheaper to unique than a 2-D array
+        keys, counts = np.unique(self.row_index()[hit] * width + ids, return_counts=True)
+        return keys // width, keys % width, counts
+
+
+def overlap_scores(matrix: TokenMatrix, query_ids: List[int]) -> np.ndarray:
+    """|query tokens ∩ title tokens| / |query tokens| per row (the original keyword score)"""
+    query = np.unique(np.asarray(query_ids, dtype=np.int64))
+    if not len(query):
+        return np.zeros(len(matrix), dtype=np.float64)
+    rows, _, _ = matrix.query_pairs(query)
+    return np.bincount(rows, minlength=len(matrix)) / len(query)
+
+
+def bm25_scores(matrix: TokenMatrix, query_ids: List[int], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """Okapi BM25 of each row against the query, with statistics over the rows themselves"""
+    n = len(matrix)
+    scores = np.zeros(n, dtype=np.float64)
+    rows, tokens, tf = matrix.query_pairs(np.unique(np.asarray(query_ids, dtype=np.int64)))
+    if not len(rows):
+        return scores
+
+    lengths = np.diff(matrix.indptr).astype(np.float64)
+    avg_length = lengths.mean() or 1.0
+    token_values, df = np.unique(tokens, return_counts=True)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    term_idf = idf[np.searchsorted(token_values, tokens)]
+    norm = k1 * (1 - b + b * lengths[rows] / avg_length)
+    np.add.at(scores, rows, term_idf * tf * (k1 + 1) / (tf + norm))
+    return scores
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first, ties in index order.
+
+    Same order as a stable sort on -score, but O(n) via argpartition.
+    """
+    n = len(scores)
+    if k <= 0 or not n:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(n)
+    return selected[np.lexsort((selected, -scores[selected]))]
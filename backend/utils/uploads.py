@@ -0,0 +1,38 @@
+import os
+import hashlib
+import tempfile
+from typing import BinaryIO, Tuple
+
+CHUNK_SIZE = 1 << 20
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def stream_to_file(stream: BinaryIO, directory: str, max_bytes: int,
+                   chunk_size: int = CHUNK_SIZE) -> Tuple[str, int, str]:
+    """Copy a request stream to a temp file in fixed-size chunks, hashing as it goes.
+
+    Returns (temp path, size, sha256). Memory use is one chunk regardless of
+    the upload size. The temp file is removed if the stream exceeds max_bytes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, size, digest.hexdigest()
@@ -0,0 +1,326 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+from typing import List, Dict, Any, Callable
+import numpy as np
+
+from utils.embedding_store import l2_normalize
+
+
+def document_key(filename: str, outline: List[Dict[str, Any]]) -> str:
+    """Identity of one extracted version of a document"""
+    digest = hashlib.sha1(filename.encode('utf-8'))
+    for heading in outline:
+        digest.update(f"\x00{heading.get('level', '')}\x00{heading.get('page', '')}\x00{heading.get('text', '')}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors; returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(vectors, centroids)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=k)
+        used = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[used])[:-1]))
+
+        # Re-seed empty clusters with random points
+        sums = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+        sums[used] = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for each row, computed in chunks"""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        out[start:start + chunk] = np.argmax(np.asarray(vectors[start:start + chunk]) @ centroids.T, axis=1)
+    return out
+
+
+class SectionIndex:
+    """Persistent IVF (inverted file) index over section-title embeddings.
+
+    Vectors are appended to a memory-mapped float32 matrix with one JSON
+    record per row. Below train_size rows queries are exact; once trained,
+    rows are bucketed by their nearest k-means centroid and a query only
+    scans the nprobe closest buckets. The index retrains when it has grown
+    retrain_factor times since the last training.
+
+    Re-indexing a filename supersedes its old rows, and removing one
+    retires them; such rows stay on disk but are filtered out of results.
+    """
+
+    def __init__(self, index_dir: str, nprobe: int = 16, train_size: int = 20000, retrain_factor: int = 8):
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.retrain_factor = retrain_factor
+        os.makedirs(index_dir, exist_ok=True)
+
+        self._vectors_path = os.path.join(index_dir, 'vectors.f32')
+        self._rows_path = os.path.join(index_dir, 'rows.jsonl')
+        self._assign_path = os.path.join(index_dir, 'assign.i32')
+        self._centroids_path = os.path.join(index_dir, 'centroids.npy')
+        self._meta_path = os.path.join(index_dir, 'meta.json')
+        self._lock_path = os.path.join(index_dir, '.lock')
+
+        self._lock = threading.RLock()
+        self._reset()
+        with self._lock:
+            self._refresh()
+
+    def _reset(self):
+        self.dim = None
+        self._meta = {"dim": None, "epoch": 0, "trained_count": 0, "documents": {}}
+        self._row_offsets = np.zeros(0, dtype=np.int64)  # byte offset of each row's record
+        self._rows_offset = 0
+        self._meta_stamp = None
+        self._indexed_rows = 0
+        self._row_doc = np.zeros(0, dtype=np.int32)
+        self._doc_ids: Dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._matrix = None
+        self._centroids = None
+        self._lists: List[List[np.ndarray]] = []
+
+    # -- persistence -------------------------------------------------------
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"dim": None, "epoch": 0, "trained_count": 0, "documents": {}}
+
+    def _write_meta(self):
+        tmp_path = f"{self._meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _refresh(self):
+        """Pick up rows, documents and retrains written by any process"""
+        try:
+            st = os.stat(self._meta_path)
+            meta_stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            meta_stamp = None
+        rows_size = os.path.getsize(self._rows_path) if os.path.exists(self._rows_path) else 0
+        if meta_stamp == self._meta_stamp and rows_size == self._rows_offset:
+            return
+
+        meta = self._read_meta()
+        if meta["epoch"] != self._meta["epoch"]:
+            # Centroids changed: rebuild everything from disk
+            self._reset()
+        self._meta = meta
+        self._meta_stamp = meta_stamp
+        self.dim = meta["dim"]
+        if self.dim is None:
+            return
+
+        if rows_size > self._rows_offset:
+            with open(self._rows_path, 'rb') as f:
+                f.seek(self._rows_offset)
+                data = f.read()
+            complete = data[:data.rfind(b'\n') + 1]
+            lines = complete.split(b'\n')[:-1]
+            # Only offsets and document ids stay in memory; records are read back on demand
+            starts = np.cumsum([0] + [len(line) + 1 for line in lines[:-1]], dtype=np.int64) + self._rows_offset
+            new_doc_ids = [self._doc_ids.setdefault(json.loads(line)["doc_key"], len(self._doc_ids)) for line in lines]
+            self._row_offsets = np.concatenate((self._row_offsets, starts[:len(lines)]))
+            self._row_doc = np.concatenate((self._row_doc, np.array(new_doc_ids, dtype=np.int32)))
+            self._rows_offset += len(complete)
+
+        count = len(self._row_offsets)
+        self._matrix = (np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(count, self.dim))
+                        if count else np.zeros((0, self.dim), dtype=np.float32))
+
+        live_keys = set(meta["documents"].values())
+        self._live = np.array([key in live_keys for key in self._doc_ids], dtype=bool)
+
+        if meta["trained_count"] and self._centroids is None:
+            self._centroids = np.load(self._centroids_path)
+            self._lists = [[] for _ in range(len(self._centroids))]
+            self._indexed_rows = 0
+        if self._centroids is not None and count > self._indexed_rows:
+            assign = np.fromfile(self._assign_path, dtype=np.int32, count=count - self._indexed_rows,
+                                 offset=4 * self._indexed_rows)
+            self._add_to_lists(np.arange(self._indexed_rows, self._indexed_rows + len(assign)), assign)
+            self._indexed_rows += len(assign)
+
+    def _add_to_lists(self, rows: np.ndarray, assign: np.ndarray):
+        order = np.argsort(assign, kind='stable')
+        rows, assign = rows[order], assign[order]
+        bounds = np.flatnonzero(np.diff(assign)) + 1
+        for chunk_rows, chunk_assign in zip(np.split(rows, bounds), np.split(assign, bounds)):
+            if len(chunk_rows):
+                self._lists[chunk_assign[0]].append(chunk_rows)
+
+    def __len__(self) -> int:
+        return int(self._live[self._row_doc].sum()) if len(self._row_doc) else 0
+
+    def documents(self) -> Dict[str, str]:
+        """Filename -> key of the indexed version of each document"""
+        with self._lock:
+            self._refresh()
+            return dict(self._meta["documents"])
+
+    # -- writes ------------------------------------------------------------
+
+    def add_document(self, filename: str, outline: List[Dict[str, Any]],
+                     embed_fn: Callable[[List[str]], np.ndarray]) -> bool:
+        """Index a document's headings; returns False if this version is already indexed"""
+        key = document_key(filename, outline)
+        with self._lock:
+            self._refresh()
+            if self._meta["documents"].get(filename) == key:
+                return False
+            # A removed version that comes back still has its rows
+            has_rows = key in self._doc_ids
+
+        # Embed outside the lock so searches and other documents are not held up
+        headings = [h for h in outline if h.get('text')]
+        vectors = l2_normalize(embed_fn([h['text'] for h in headings])) if headings and not has_rows else None
+
+        with self._lock:
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    if self._meta["documents"].get(filename) == key:
+                        return False
+                    if vectors is not None and len(vectors) and key not in self._doc_ids:
+                        self._append_rows(filename, key, headings, vectors)
+                    self._meta["documents"][filename] = key
+                    self._write_meta()
+                    self._maybe_train()
+                    self._refresh()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return True
+
+    def remove_document(self, filename: str) -> bool:
+        """Drop a document from search results; returns False if it is not indexed"""
+        with self._lock:
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    if filename not in self._meta["documents"]:
+                        return False
+                    del self._meta["documents"][filename]
+                    self._write_meta()
+                    self._refresh()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return True
+
+    def _append_rows(self, filename: str, key: str, headings: List[Dict[str, Any]], vectors: np.ndarray):
+        if self.dim is None:
+            self._meta["dim"] = self.dim = int(vectors.shape[1])
+            self._write_meta()
+
+        count = len(self._row_offsets)
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(count * 4 * self.dim)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        if self._centroids is not None:
+            with open(self._assign_path, 'ab') as f:
+                f.truncate(count * 4)
+                f.write(_nearest(vectors, self._centroids).tobytes())
+        with open(self._rows_path, 'ab') as f:
+            f.write(''.join(json.dumps({
+                "document": filename,
+                "doc_key": key,
+                "section_title": h.get('text', ''),
+                "page_number": h.get('page'),
+                "level": h.get('level')
+            }, ensure_ascii=False) + '\n' for h in headings).encode('utf-8'))
+
+    def _maybe_train(self):
+        """(Re)build centroids once the index has outgrown the current training"""
+        self._refresh()
+        count = len(self._row_offsets)
+        trained = self._meta["trained_count"]
+        if count < self.train_size or (trained and count < trained * self.retrain_factor):
+            return
+
+        nlist = max(1, min(4096, int(2 * np.sqrt(count))))
+        sample_size = min(count, max(nlist * 32, 20000))
+        sample_rows = np.sort(np.random.default_rng(0).choice(count, size=sample_size, replace=False))
+        centroids = _kmeans(np.asarray(self._matrix[sample_rows]), nlist)
+        assign = _nearest(self._matrix, centroids)
+
+        np.save(self._centroids_path + '.tmp.npy', centroids)
+        os.replace(self._centroids_path + '.tmp.npy', self._centroids_path)
+        assign.tofile(self._assign_path)
+        self._meta["trained_count"] = count
+        self._meta["epoch"] += 1
+        self._write_meta()
+        # Drop the in-memory lists so the next refresh loads the new centroids
+        self._reset()
+
+    # -- queries -----------------------------------------------------------
+
+    def search(self, query: np.ndarray, top_k: int = 15) -> List[Dict[str, Any]]:
+        """Return the top_k live sections most similar to the query vector"""
+        with self._lock:
+            self._refresh()
+            if not len(self._row_offsets):
+                return []
+            query = l2_normalize(np.asarray(query).reshape(1, -1))[0]
+
+            if self._centroids is None:
+                rows = np.arange(len(self._row_offsets))
+                vectors = np.asarray(self._matrix)
+            else:
+                nprobe = min(self.nprobe, len(self._centroids))
+                probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+                chunks = []
+                for list_id in probes:
+                    if len(self._lists[list_id]) > 1:
+                        self._lists[list_id] = [np.concatenate(self._lists[list_id])]
+                    chunks.extend(self._lists[list_id])
+                rows = np.sort(np.concatenate(chunks)) if chunks else np.zeros(0, dtype=np.int64)
+                vectors = np.asarray(self._matrix[rows])
+
+            live = self._live[self._row_doc[rows]]
+            rows, vectors = rows[live], vectors[live]
+            if not len(rows):
+                return []
+
+            scores = vectors @ query
+            k = min(top_k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+
+            results = []
+            with open(self._rows_path, 'rb') as f:
+                for i in top:
+                    f.seek(self._row_offsets[rows[i]])
+                    record = json.loads(f.readline())
+                    results.append({
+                        "document": record["document"],
+                        "section_title": record["section_title"],
+                        "page_number": record["page_number"],
+                        "level": record["level"],
+                        "score": float(scores[i])
+                    })
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rows": len(self._row_offsets),
+                "live_rows": len(self),
+                "documents": len(self._meta["documents"]),
+                "lists": len(self._centroids) if self._centroids is not None else 0,
+                "trained_count": self._meta["trained_count"]
+            }